@@ -0,0 +1,125 @@
+import argparse
+import statistics
+import sys
+import tracemalloc
+
+from simulation.classes import Lot
+from simulation.file_instance import FileInstance
+from simulation.greedy import simulate
+from simulation.dispatching.dispatcher import dispatcher_map
+from simulation.randomizer import Randomizer
+from simulation.read import read_all
+
+
+class BaselineLot:
+    # the lot layout before __slots__ and the route cursor: an instance dict and a copy of the route's steps,
+    # split into processed and remaining steps
+    def __init__(self, idx, route, priority, release, relative_deadline, d):
+        self.idx = idx
+        self.remaining_steps = [step for step in route.steps]
+        self.actual_step = None
+        self.processed_steps = []
+        self.priority = priority
+        self.release_at = release
+        self.deadline_at = self.release_at + relative_deadline
+        self.name = d['LOT']
+        self.part_name = d['PART']
+        if 'Init_' in self.name:
+            self.name = self.name[self.name.index('_') + 1:self.name.rindex('_')]
+
+        if 'CURSTEP' in d:
+            cs = d['CURSTEP']
+            self.processed_steps, self.remaining_steps = self.remaining_steps[:cs - 1], self.remaining_steps[cs - 1:]
+
+        self.pieces = d['PIECES']
+        self.waiting_machines = []
+        self.done_at = None
+        self.free_since = None
+        self.remaining_steps_last = -1
+        self.remaining_time_last = 0
+        self.dedications = {}
+        self.waiting_time = 0
+        self.waiting_time_batching = 0
+        self.processing_time = 0
+        self.transport_time = 0
+        self.cqt_waiting = None
+        self.cqt_deadline = None
+        self.ft = None
+
+    @staticmethod
+    def of(lot):
+        # baseline lot at the same position of the same route, with the same waiting machines and dedications
+        b = BaselineLot.__new__(BaselineLot)
+        b.__dict__.update({name: value for name, value in attributes(lot) if name not in
+                           ['steps', 'time_left', 'processed_count', 'position', 'reworked', 'lot_index', 'advances',
+                            'draws', 'ptuple']})
+        b.processed_steps = list(lot.processed_steps)
+        b.remaining_steps = list(lot.remaining_steps)
+        b.waiting_machines = list(lot.waiting_machines)
+        b.dedications = dict(lot.dedications)
+        b.remaining_steps_last = -1
+        b.remaining_time_last = 0
+        b.ft = None
+        return b
+
+
+def attributes(obj):
+    if hasattr(obj, '__dict__'):
+        yield from vars(obj).items()
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                yield name, getattr(obj, name)
+
+
+def owned_size(obj):
+    # the object, its attribute dict and the containers it owns, shared objects (steps, routes) are not counted
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(vars(obj))
+    for _, value in attributes(obj):
+        if type(value) in [list, dict, set]:
+            size += sys.getsizeof(value)
+    return size
+
+
+def allocated_per_lot(instance, n, cls):
+    # bytes allocated while creating n lots of the first product
+    lot = instance.active_lots[0]
+    route = instance.routes[next(iter(instance.routes))]
+    d = {'LOT': lot.name, 'PART': lot.part_name, 'PIECES': lot.pieces}
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    lots = [cls(i, route, lot.priority, 0, 0, d) for i in range(n)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(s.size_diff for s in after.compare_to(before, 'filename'))
+    del lots
+    return allocated / n
+
+
+def main():
+    p = argparse.ArgumentParser(description='Memory footprint of a lot, compared with the dict based lot that copied its route')
+    p.add_argument('--dataset', type=str, default='SMT2020_HVLM')
+    p.add_argument('--days', type=int, default=5)
+    p.add_argument('--lots', type=int, default=10000)
+    a = p.parse_args()
+
+    files = read_all('datasets/' + a.dataset)
+    run_to = 3600 * 24 * a.days
+    Randomizer().random.seed(0)
+    instance = FileInstance(files, run_to, True, [])
+    simulate(instance, dispatcher_map['fifo'], run_to, True, progress=False)
+
+    active = statistics.mean([owned_size(lot) for lot in instance.active_lots])
+    baseline = statistics.mean([owned_size(BaselineLot.of(lot)) for lot in instance.active_lots])
+    allocated = allocated_per_lot(instance, a.lots, Lot)
+    baseline_allocated = allocated_per_lot(instance, a.lots, BaselineLot)
+    print('Lots in the fab after', a.days, 'days:', len(instance.active_lots))
+    print('', 'baseline', 'Lot', 'ratio', sep='\t')
+    print('Owned bytes per active lot', round(baseline), round(active), round(baseline / active, 1), sep='\t')
+    print('Allocated bytes per new lot', round(baseline_allocated), round(allocated),
+          round(baseline_allocated / allocated, 1), sep='\t')
+
+if __name__ == '__main__':
+    main()
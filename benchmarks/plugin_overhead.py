@@ -0,0 +1,102 @@
+import argparse
+import time
+from collections import Counter
+
+from simulation.dispatching.dispatcher import dispatcher_map
+from simulation.file_instance import FileInstance
+from simulation.greedy import simulate
+from simulation.plugins.interface import IPlugin, PluginHooks, HOOKS
+from simulation.randomizer import Randomizer
+from simulation.read import read_all
+
+# hooks called while events are processed, on_sim_init / on_sim_done / on_sim_resume run once per simulation
+EVENT_HOOKS = [hook for hook in HOOKS if hook not in ['on_sim_init', 'on_sim_done', 'on_sim_resume']]
+
+HOOK_ARGS = {
+    'on_lots_release': 2, 'on_lot_done': 2, 'on_step_done': 3, 'on_dispatch': 5, 'on_machine_free': 2,
+    'on_lot_free': 2, 'on_breakdown': 2, 'on_preventive_maintenance': 2, 'on_cqt_violated': 3,
+}
+
+
+class CountingPlugin(IPlugin):
+    def __init__(self):
+        self.calls = Counter()
+
+    def on_lots_release(self, instance, lots):
+        self.calls['on_lots_release'] += 1
+
+    def on_lot_done(self, instance, lot):
+        self.calls['on_lot_done'] += 1
+
+    def on_step_done(self, instance, lot, step):
+        self.calls['on_step_done'] += 1
+
+    def on_dispatch(self, instance, machine, lots, machine_end_time, lot_end_time):
+        self.calls['on_dispatch'] += 1
+
+    def on_machine_free(self, instance, machine):
+        self.calls['on_machine_free'] += 1
+
+    def on_lot_free(self, instance, lot):
+        self.calls['on_lot_free'] += 1
+
+    def on_breakdown(self, instance, breakdown_event):
+        self.calls['on_breakdown'] += 1
+
+    def on_preventive_maintenance(self, instance, preventive_maintenance_event):
+        self.calls['on_preventive_maintenance'] += 1
+
+    def on_cqt_violated(self, instance, machine, lot):
+        self.calls['on_cqt_violated'] += 1
+
+
+class SimDoneOnlyPlugin(IPlugin):
+    # like CostPlugin before it kept running totals: only the final hook does work
+    def on_sim_done(self, instance):
+        pass
+
+
+def hook_calls(files, days):
+    # how often the simulator fires each hook for one fixed-seed run
+    run_to = 3600 * 24 * days
+    Randomizer().random.seed(0)
+    counting = CountingPlugin()
+    instance = FileInstance(files, run_to, True, [counting])
+    simulate(instance, dispatcher_map['fifo'], run_to, True, progress=False)
+    return counting.calls, instance.events.handled
+
+
+def replay(calls, plugin_lists):
+    # fires every hook as often as the simulation did, with the given plugin list per hook
+    start = time.perf_counter()
+    for hook in EVENT_HOOKS:
+        plugins = plugin_lists[hook]
+        args = (None,) * HOOK_ARGS[hook]
+        for _ in range(calls[hook]):
+            for plugin in plugins:
+                getattr(plugin, hook)(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description='Plugin hook overhead per simulation event with 0, 1 and 3 plugins')
+    p.add_argument('--dataset', type=str, default='SMT2020_HVLM')
+    p.add_argument('--days', type=int, default=2)
+    p.add_argument('--repeat', type=int, default=5)
+    a = p.parse_args()
+
+    calls, events = hook_calls(read_all('datasets/' + a.dataset), a.days)
+    print('Events', events, 'hook calls', dict(calls))
+    print('Plugins', 'all plugins ns/event', 'hook tables ns/event', sep='\t')
+    for n in [0, 1, 3]:
+        plugins = [SimDoneOnlyPlugin() for _ in range(n)]
+        every_hook = {hook: plugins for hook in EVENT_HOOKS}
+        hooks = PluginHooks(plugins)
+        tables = {hook: getattr(hooks, hook) for hook in EVENT_HOOKS}
+        before = min(replay(calls, every_hook) for _ in range(a.repeat)) / events * 1e9
+        after = min(replay(calls, tables) for _ in range(a.repeat)) / events * 1e9
+        print(n, round(before), round(after), sep='\t')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import time
+
+START = time.perf_counter()
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+
+# results that get worse when they go up, everything else gets worse when it goes down
+LOWER_IS_BETTER = {'import_s', 'startup_s', 'wall_s', 'peak_rss_mb'}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 1024
+
+
+def run_case(dataset, alg, days, dispatcher, seed):
+    # runs in a fresh interpreter, so import time and peak RSS belong to this case only
+    from simulation.dispatching.dispatcher import dispatcher_map
+    from simulation.file_instance import FileInstance
+    from simulation.greedy import simulate
+    from simulation.plugins.interface import IPlugin
+    from simulation.randomizer import Randomizer
+    from simulation.read import read_all
+    imported = time.perf_counter()
+
+    class DispatchCounter(IPlugin):
+        def __init__(self):
+            self.dispatches = 0
+
+        def on_dispatch(self, instance, machine, lots, machine_end_time, lot_end_time):
+            self.dispatches += 1
+
+    run_to = 3600 * 24 * days
+    Randomizer().random.seed(seed)
+    counter = DispatchCounter()
+    l4m = alg == 'l4m'
+    instance = FileInstance(read_all('datasets/' + dataset), run_to, l4m, [counter])
+    started = time.perf_counter()
+    simulate(instance, dispatcher_map[dispatcher], run_to, l4m, progress=False)
+    done = time.perf_counter()
+
+    wall = done - started
+    return {
+        'dataset': dataset, 'alg': alg, 'days': days, 'dispatcher': dispatcher, 'seed': seed,
+        'import_s': imported - START,
+        'startup_s': started - imported,
+        'wall_s': wall,
+        'events': instance.events.handled,
+        'events_per_s': instance.events.handled / wall,
+        'dispatches': counter.dispatches,
+        'dispatches_per_s': counter.dispatches / wall,
+        'sim_days_per_s': instance.current_time_days / wall,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def case_name(r):
+    return f"{r['dataset']}_{r['alg']}_{r['dispatcher']}_{r['days']}days"
+
+
+def compare(results, baseline, tolerance):
+    # prints the change against the baseline, returns the names of metrics worse than the tolerance
+    regressions = []
+    print('Case', 'Metric', 'Baseline', 'Now', 'Change', sep='\t')
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        for metric, value in r.items():
+            old = baseline[name].get(metric)
+            if type(value) is not float or not old:
+                continue
+            change = (value - old) / old
+            worse = change if metric in LOWER_IS_BETTER else -change
+            flag = ' !' if worse > tolerance else ''
+            if worse > tolerance:
+                regressions.append(f'{name} {metric}')
+            print(name, metric, round(old, 3), round(value, 3), f'{round(change * 100, 1)}%{flag}', sep='\t')
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description='Fixed-seed simulator throughput on the SMT2020 datasets')
+    p.add_argument('--datasets', type=str, nargs='+', default=['SMT2020_HVLM', 'SMT2020_LVHM'])
+    p.add_argument('--algs', type=str, nargs='+', default=['l4m', 'm4l'], choices=['l4m', 'm4l'])
+    p.add_argument('--days', type=int, default=10)
+    p.add_argument('--dispatcher', type=str, default='fifo')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--out', type=str, default='benchmarks/results/latest.json')
+    p.add_argument('--baseline', type=str, default=None, help='results JSON to compare against')
+    p.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown counted as regression')
+    p.add_argument('--case', action='store_true', help=argparse.SUPPRESS)
+    a = p.parse_args()
+
+    if a.case:
+        print(json.dumps(run_case(a.datasets[0], a.algs[0], a.days, a.dispatcher, a.seed)))
+        return
+
+    from simulation.read import read_all
+    for dataset in a.datasets:
+        read_all('datasets/' + dataset)  # parse once, the cases load the cached datasets
+
+    results = {}
+    for dataset in a.datasets:
+        for alg in a.algs:
+            cmd = [sys.executable, '-m', 'benchmarks.throughput', '--case', '--datasets', dataset, '--algs', alg,
+                   '--days', str(a.days), '--dispatcher', a.dispatcher, '--seed', str(a.seed)]
+            r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout)
+            results[case_name(r)] = r
+            sys.stderr.write(f"{case_name(r)}: {round(r['events_per_s'])} events/s, "
+                             f"{round(r['dispatches_per_s'])} dispatches/s, "
+                             f"{round(r['sim_days_per_s'], 3)} days/s, {round(r['peak_rss_mb'])} MB\n")
+
+    os.makedirs(os.path.dirname(a.out) or '.', exist_ok=True)
+    with io.open(a.out, 'w') as f:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results}, f,
+                  indent=1)
+
+    if a.baseline is not None:
+        with io.open(a.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, a.tolerance)
+        if len(regressions) > 0:
+            sys.stderr.write('Regressions: ' + ', '.join(regressions) + '\n')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
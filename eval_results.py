@@ -4,6 +4,11 @@ import statistics
 from collections import defaultdict
 from os import listdir, path
 
+from simulation.result_store import aggregate
+
+# greedy runs written with main.py --store, aggregated by SQL instead of re-reading their JSON files
+STORE = 'greedy/results.sqlite'
+
 
 def read_references():
     out = {}
@@ -51,10 +56,18 @@ def main():
     lots = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
     machines = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
 
+    stored = set()
+    if path.isfile(STORE):
+        for (method, ds, dispatcher, days), (n, avgs) in aggregate(STORE).items():
+            stored.add(f'{method}_{days}days_{ds}_{dispatcher}.json')
+            results[f'{n}x {method}_{days}days_{ds}_{dispatcher}.json'] = {'avgs': avgs}
+
     for d in dirs:
         subs = listdir(d)
         for s in subs:
-            if path.isfile(d + '/' + s) and 'seed0' in s and s.endswith('.json'):
+            if path.isfile(d + '/' + s) and 'seed0' in s and s.endswith('.json') and s.replace('seed0_', '') in stored:
+                continue
+            elif path.isfile(d + '/' + s) and 'seed0' in s and s.endswith('.json'):
                 file_locs = [d + '/' + s.replace('seed0_', f'seed{r}_') for r in range(runs)]
                 name = f'{len(file_locs)}x {s.replace("seed0_", "")}'
                 results[name] = {'files': file_locs}
@@ -74,9 +87,10 @@ def main():
     for name in results.keys():
         names.add(name)
         d = results[name]
-        files = d['files']
-        datas = [json.loads(loadfile(f)) for f in files]
-        r = d['avgs'] = handle_obj(datas)
+        if 'avgs' not in d:
+            datas = [json.loads(loadfile(f)) for f in d['files']]
+            d['avgs'] = handle_obj(datas)
+        r = d['avgs']
         for k, v in sorted(r['lots'].items(), key=lambda k: k[0]):
             lots[k][name] = dict(
                 act=round(v["ACT"][0], 2),
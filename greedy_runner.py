@@ -18,7 +18,8 @@ for seed in [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]:
                     print(name_)
                     subprocess.call(['pypy3', 'main.py', '--days', str(day_),
                                      '--dataset', dataset_, '--dispatcher', dispatcher_, '--seed', str(seed),
-                                     '--alg', 'l4m'], stdout=f)
+                                     '--alg', 'l4m', '--report-days', '180', '365',
+                                     '--store', 'greedy/results.sqlite'], stdout=f)
 
 
             t = threading.Thread(target=s, args=(day, dataset, dispatcher))
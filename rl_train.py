@@ -1,3 +1,4 @@
+import argparse
 import datetime
 import json
 import os
@@ -11,10 +12,9 @@ from stable_baselines3 import PPO
 from wandb.integration.sb3 import WandbCallback
 
 from simulation.gym.environment import DynamicSCFabSimulationEnvironment
+from simulation.gym.vec_env import make_vec_env
 from stable_baselines3.common.callbacks import CheckpointCallback
 
-from sys import argv
-
 from simulation.gym.sample_envs import DEMO_ENV_1
 
 
@@ -31,21 +31,25 @@ def main():
                 remaining = (time.time() - t) / ratio * (1 - ratio) if ratio > 0 else 9999999999999
                 remaining /= 3600
 
-                sys.stderr.write(f'\r{self.num_timesteps} / {to_train} {perc}% {round(remaining, 2)} hours left    {env.instance.current_time_days}      ')
+                sys.stderr.write(f'\r{self.num_timesteps} / {to_train} {perc}% {round(remaining, 2)} hours left    {env.get_attr("current_time_days", 0)[0]}      ')
             return super().on_step()
 
-    fn = argv[1]
+    ap = argparse.ArgumentParser()
+    ap.add_argument('config', type=str)
+    ap.add_argument('--workers', type=int, default=1, help='number of simulations running in parallel processes')
+    a = ap.parse_args()
+    fn = a.config
     with open(fn, 'r') as config:
         p = json.load(config)['params']
     args = dict(num_actions=p['action_count'], active_station_group=p['station_group'],
                 days=p['training_period'], dataset='SMT2020_' + p['dataset'],
                 dispatcher=p['dispatcher'])
-    env = DynamicSCFabSimulationEnvironment(**DEMO_ENV_1, **args, seed=p['seed'], max_steps=1000000, reward_type=p['reward'])
+    env = make_vec_env(a.workers, **DEMO_ENV_1, **args, seed=p['seed'], max_steps=1000000, reward_type=p['reward'])
     eval_env = DynamicSCFabSimulationEnvironment(**DEMO_ENV_1, **args, seed=777, max_steps=10000, reward_type=p['reward'])
     model = PPO("MlpPolicy", env, verbose=1)
 
     p = os.path.dirname(os.path.realpath(fn))
-    checkpoint_callback = MyCallBack(save_freq=100000, save_path=p, name_prefix='checkpoint_')
+    checkpoint_callback = MyCallBack(save_freq=max(1, 100000 // a.workers), save_path=p, name_prefix='checkpoint_')
     model.learn(
         total_timesteps=to_train, eval_freq=4000000, eval_env=eval_env, n_eval_episodes=1,
         callback=checkpoint_callback
@@ -0,0 +1,76 @@
+import gzip
+import os
+import pickle
+import sys
+import time
+
+from simulation.randomizer import Randomizer
+
+CHECKPOINT_VERSION = 5
+# pickling follows lot -> machine -> lot references recursively
+RECURSION_LIMIT = 20000
+
+
+class Checkpoints:
+    # writes a checkpoint of the instance every `every` simulated seconds, the due times are multiples of `every`
+    # so a resumed run keeps writing at the same simulated times
+
+    def __init__(self, path, every, args=None):
+        self.path = path
+        self.every = every
+        self.args = args
+        self.due = None
+
+    def maybe_save(self, instance):
+        if self.due is None:
+            self.due = (instance.current_time // self.every + 1) * self.every
+        if instance.current_time >= self.due:
+            seconds, size = save_checkpoint(instance, self.path, self.args)
+            self.due = (instance.current_time // self.every + 1) * self.every
+            sys.stderr.write(f'\nCheckpoint at day {instance.current_time_days:.1f}: {size / 2 ** 20:.1f} MiB '
+                             f'written to {self.path} in {seconds:.2f}s\n')
+            sys.stderr.flush()
+
+
+def save_checkpoint(instance, path, args=None):
+    # full simulation state (event queue, lots, machines, dispatch manager, plugins) and the RNG state, written to a
+    # temporary file first so that an interrupted write never replaces the last good checkpoint
+    start = time.perf_counter()
+    state = {k: v for k, v in instance.__dict__.items() if k != 'randomizer'}
+    checkpoint = {'version': CHECKPOINT_VERSION, 'class': type(instance), 'state': state,
+                  'random_state': instance.randomizer.getstate(), 'args': args}
+    tmp = path + '.tmp'
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        with open(tmp, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+                pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+            raw.flush()
+            os.fsync(raw.fileno())
+    finally:
+        sys.setrecursionlimit(limit)
+    os.replace(tmp, path)
+    return time.perf_counter() - start, os.path.getsize(path)
+
+
+def load_checkpoint(path, randomizer=None):
+    # returns (instance, args) of the checkpoint, the instance draws from randomizer (the process wide Randomizer by
+    # default) which continues where the checkpointed RNG stopped
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        with gzip.open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+    finally:
+        sys.setrecursionlimit(limit)
+    if checkpoint['version'] != CHECKPOINT_VERSION:
+        raise ValueError(f'{path}: checkpoint version {checkpoint["version"]}, expected {CHECKPOINT_VERSION}')
+    cls = checkpoint['class']
+    instance = cls.__new__(cls)
+    instance.__dict__.update(checkpoint['state'])
+    instance.randomizer = randomizer if randomizer is not None else Randomizer()
+    instance.randomizer.setstate(checkpoint['random_state'])
+    for plugin in instance.hooks.on_sim_resume:
+        plugin.on_sim_resume(instance)
+    return instance, checkpoint['args']
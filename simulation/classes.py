@@ -1,12 +1,10 @@
 from typing import List, Dict
 
 from simulation.events import BreakdownEvent
-from simulation.randomizer import Randomizer
 from simulation.tools import get_interval, get_distribution, date_time_parse, ConstantDistribution
 
-r = Randomizer()
-
-machine_classes = {}
+# positions of the per-step common random numbers of a lot
+SAMPLING, REWORK, PROCESSING, TRANSPORT, CASCADING = range(5)
 
 
 def alt(d, a1, a2):
@@ -22,8 +20,15 @@ def none_is_0(v):
 
 
 class Machine:
-
-    def __init__(self, idx, d, speed):
+    __slots__ = ('idx', 'load_time', 'unload_time', 'group', 'machine_class', 'loc', 'family', 'cascading', 'speed',
+                 'minimize_setup_time', 'available_from', 'available_to', 'piece_per_maintenance',
+                 'pieces_until_maintenance', 'maintenance_time', 'waiting_lots', 'utilized_time', 'setuped_time',
+                 'pmed_time', 'bred_time', 'current_setup', 'last_setup', 'events', 'min_runs_left', 'min_runs_setup',
+                 'pms', 'last_actions', 'last_setup_time', 'dispatch_failed', 'has_min_runs',
+                 'next_preventive_maintenance', 'lot_index', 'actions', 'maintenances', 'setup_id')
+
+    def __init__(self, idx, d, speed, machine_classes):
+        # machine_classes: station group -> class id of the instance being built, ids in order of first appearance
         self.idx = idx
         self.load_time = none_is_0(get_interval(d['LTIME'], d['LTUNITS']))
         self.unload_time = none_is_0(get_interval(d['ULTIME'], d['ULTUNITS']))
@@ -44,7 +49,8 @@ class Machine:
         self.pieces_until_maintenance = []
         self.maintenance_time = []
 
-        self.waiting_lots: List[Lot] = []
+        # lot idx -> lot in the order the lots started waiting for the machine
+        self.waiting_lots: Dict[int, Lot] = {}
 
         self.utilized_time = 0
         self.setuped_time = 0
@@ -52,6 +58,9 @@ class Machine:
         self.bred_time = 0
 
         self.current_setup = ''
+        self.last_setup = ''
+        # id of current_setup in the instance's SetupMatrix
+        self.setup_id = 0
 
         self.events = []
         self.min_runs_left = None
@@ -68,20 +77,38 @@ class Machine:
 
         self.next_preventive_maintenance = None
 
+        self.lot_index = None
+        self.actions = None
+        self.maintenances = 0
+
     def __hash__(self):
         return self.idx
 
     def __repr__(self):
         return f'Machine {self.idx}'
 
+    def sample_maintenance_time(self, i, randomizer):
+        # per-piece maintenance length, from the machine's own stream with common random numbers
+        if randomizer.crn_seed is None:
+            return self.maintenance_time[i].sample(randomizer)
+        self.maintenances += 1
+        u = randomizer.uniforms(1, 'maintenance', self.idx, self.maintenances)[0]
+        return self.maintenance_time[i].sample_from(u)
+
 
 class Product:
+    __slots__ = ('route', 'priority')
+
     def __init__(self, route, priority):
         self.route = route
         self.priority = priority
 
 
 class Step:
+    __slots__ = ('idx', 'order', 'step_name', 'family', 'setup_needed', 'setup_time', 'rework_step', 'cascading',
+                 'processing_time', 'cascading_time', 'batching', 'batch_min', 'batch_max', 'sampling_percent',
+                 'rework_percent', 'cqt_for_step', 'cqt_time', 'lot_to_lens_dedication', 'family_location',
+                 'transport_time', 'setup_id')
 
     def __init__(self, idx, pieces_per_lot, d):
         self.idx = idx
@@ -90,6 +117,8 @@ class Step:
         self.family = d['STNFAM']
         self.setup_needed = d['SETUP']
         self.setup_time = get_interval(d['STIME'], d['STUNITS']) if type(d['STIME']) is int else None
+        # id of setup_needed, assigned when the instance compiles its SetupMatrix
+        self.setup_id = 0
         self.rework_step = d['RWKSTEP']
         assert len(self.family) > 0
         self.cascading = False
@@ -126,37 +155,51 @@ class Step:
         self.family_location = ''
         self.transport_time = ConstantDistribution(0)
 
-        self.reworked = {}
-
-    def has_to_perform(self):
+    def has_to_perform(self, lot, randomizer):
         if self.sampling_percent == 100:
             return True
-        return r.random.uniform(0, 100) <= self.sampling_percent
+        if lot.draws is not None:
+            return lot.draws[SAMPLING] * 100 <= self.sampling_percent
+        return randomizer.random.uniform(0, 100) <= self.sampling_percent
 
-    def has_to_rework(self, lot_id):
-        if self.rework_percent == 0 or lot_id in self.reworked:
+    def has_to_rework(self, lot, randomizer):
+        # a lot is reworked at most once per step, the lot remembers the steps it was checked at
+        if self.rework_percent == 0:
+            return False
+        if lot.reworked is None:
+            lot.reworked = set()
+        elif self.idx in lot.reworked:
             return False
-        self.reworked[lot_id] = True
-        return r.random.uniform(0, 100) <= self.rework_percent
+        lot.reworked.add(self.idx)
+        if lot.draws is not None:
+            return lot.draws[REWORK] * 100 <= self.rework_percent
+        return randomizer.random.uniform(0, 100) <= self.rework_percent
 
 
 class Lot:
+    # the route is shared by all lots, a lot only keeps its position in it:
+    # processed_steps = steps[:processed_count], remaining_steps = steps[position:]
+    __slots__ = ('idx', 'steps', 'time_left', 'processed_count', 'position', 'actual_step', 'priority', 'release_at',
+                 'deadline_at', 'name', 'part_name', 'pieces', 'waiting_machines', 'done_at', 'free_since',
+                 'reworked', 'dedications', 'waiting_time', 'waiting_time_batching', 'processing_time',
+                 'transport_time', 'cqt_waiting', 'cqt_deadline', 'ptuple', 'lot_index', 'advances', 'draws')
+
     def __init__(self, idx, route, priority, release, relative_deadline, d):
         self.idx = idx
-        self.remaining_steps = [step for step in route.steps]
+        self.steps = route.steps
+        self.time_left = route.time_left
+        self.processed_count = 0
+        self.position = 0
         self.actual_step: Step = None
-        self.processed_steps = []
         self.priority = priority
         self.release_at = release
         self.deadline_at = self.release_at + relative_deadline
-        self.name: str = d['LOT']
+        self.name: str = Lot.product_name(d['LOT'])
         self.part_name: str = d['PART']
-        if 'Init_' in self.name:
-            self.name = self.name[self.name.index('_') + 1:self.name.rindex('_')]
 
         if 'CURSTEP' in d:
-            cs = d['CURSTEP']
-            self.processed_steps, self.remaining_steps = self.remaining_steps[:cs - 1], self.remaining_steps[cs - 1:]
+            # same as slicing the step list at CURSTEP - 1
+            self.position = self.processed_count = len(range(len(self.steps))[:d['CURSTEP'] - 1])
 
         self.pieces = d['PIECES']
 
@@ -165,8 +208,8 @@ class Lot:
         self.done_at = None
         self.free_since = None
 
-        self.remaining_steps_last = -1
-        self.remaining_time_last = 0
+        # indices of the steps where rework was already decided
+        self.reworked = None
 
         self.dedications = {}
 
@@ -178,7 +221,12 @@ class Lot:
         self.cqt_waiting = None
         self.cqt_deadline = None
 
-        self.ft = None
+        self.ptuple = None
+        self.lot_index = None
+
+        # common random numbers of the actual step, drawn from the stream keyed by lot idx and step count
+        self.advances = 0
+        self.draws = None
 
     def __hash__(self):
         return self.idx
@@ -186,38 +234,78 @@ class Lot:
     def __repr__(self):
         return f'Lot {self.idx}'
 
+    @staticmethod
+    def product_name(name):
+        if 'Init_' in name:
+            return name[name.index('_') + 1:name.rindex('_')]
+        return name
+
+    @property
+    def processed_steps(self):
+        return self.steps[:self.processed_count]
+
+    @property
+    def remaining_steps(self):
+        return self.steps[self.position:]
+
+    @property
+    def steps_left(self):
+        return len(self.steps) - self.position
+
+    @property
+    def next_step(self):
+        return self.steps[self.position] if self.position < len(self.steps) else None
+
+    def advance(self, randomizer):
+        # the actual step is finished, the next remaining step becomes the actual one
+        if self.actual_step is not None:
+            self.processed_count += 1
+            if self.actual_step.has_to_rework(self, randomizer):
+                # back to the rework step, same as slicing processed_steps at rework_step - 1
+                self.processed_count = len(range(self.processed_count)[:self.actual_step.rework_step - 1])
+                self.position = self.processed_count
+        self.actual_step = self.steps[self.position]
+        self.position += 1
+        if randomizer.crn_seed is not None:
+            self.draws = randomizer.uniforms(5, 'lot', self.idx, self.advances)
+            self.advances += 1
+
+    def sample(self, distribution, draw, randomizer):
+        if self.draws is None:
+            return distribution.sample(randomizer)
+        return distribution.sample_from(self.draws[draw])
+
     def cr(self, time):
         rt = self.remaining_time
         return (self.deadline_at - time) / rt if rt > 0 else 1
 
     @property
     def full_time(self):
-        if self.ft is None:
-            self.ft = sum(
-                [s.processing_time.avg() for s in self.processed_steps +
-                 ([self.actual_step] if self.actual_step is not None else []) + self.remaining_steps])
-        return self.ft
+        done = self.time_left[0] - self.time_left[self.processed_count]
+        actual = self.actual_step.processing_time.avg() if self.actual_step is not None else 0
+        return done + actual + self.time_left[self.position]
 
     @property
     def remaining_time(self):
-        if self.remaining_steps_last != len(self.remaining_steps):
-            if self.remaining_steps_last - 1 == len(self.remaining_steps):
-                self.remaining_time_last -= self.processed_steps[-1].processing_time.avg()
-            else:
-                self.remaining_time_last = sum(
-                    [s.processing_time.avg() for s in self.remaining_steps]) + self.actual_step.processing_time.avg()
-            self.remaining_steps_last = len(self.remaining_steps)
-        return self.remaining_time_last
+        actual = self.actual_step.processing_time.avg() if self.actual_step is not None else 0
+        return self.time_left[self.position] + actual
 
 
 class Route:
+    __slots__ = ('idx', 'steps', 'time_left')
 
     def __init__(self, idx, steps: List[Step]):
         self.idx = idx
-        self.steps = steps
+        self.steps = tuple(steps)
+        # time_left[i]: sum of the average processing times of steps[i:]
+        time_left = [0] * (len(self.steps) + 1)
+        for i in range(len(self.steps) - 1, -1, -1):
+            time_left[i] = time_left[i + 1] + self.steps[i].processing_time.avg()
+        self.time_left = tuple(time_left)
 
 
 class FileRoute(Route):
+    __slots__ = ()
 
     def __init__(self, idx, pieces_per_lot, steps: List[Dict]):
         steps = [Step(i, pieces_per_lot, d) for i, d in enumerate(steps)]
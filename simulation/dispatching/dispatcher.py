@@ -1,58 +1,64 @@
 from simulation.classes import Lot, Machine
-from simulation.randomizer import Randomizer
-
-r = Randomizer()
 
 
 class Dispatchers:
     """디스패칭 전략 클래스 - 로트의 우선순위 튜플(ptuple)을 계산"""
 
     @staticmethod
-    def get_setup(new_setup, machine, actual_step_setup_time, setups):
+    def get_setup(step, machine, setups):
         """setup 변경에 필요한 시간 계산
 
         - setup 변경이 필요 없으면 0 반환
         - Step에 setup_time이 있으면 그 값 사용
-        - 없으면 setups 딕셔너리에서 (현재setup, 새setup) 조회
+        - 없으면 SetupMatrix의 정수 id 행렬에서 (현재setup, 새setup) 조회
         """
-        if new_setup != '' and machine.current_setup != new_setup:
-            if actual_step_setup_time is not None:
-                return actual_step_setup_time
-            elif (machine.current_setup, new_setup) in setups:
-                return setups[(machine.current_setup, new_setup)]
-            elif ('', new_setup) in setups:
-                return setups[('', new_setup)]
-        return 0
+        if step.setup_time is not None and step.setup_id != 0 and step.setup_id != machine.setup_id:
+            return step.setup_time
+        return setups.times[machine.setup_id][step.setup_id]
+
+    @staticmethod
+    def machine_ptuple(lot_key, machine: Machine, step, setups):
+        """lot key에 머신 의존 요소(min_runs 준수, setup 시간)를 합쳐 ptuple 생성"""
+        return (
+            # min_runs 제약: 0=준수, 1=위반
+            0 if machine.min_runs_left is None or machine.min_runs_setup == step.setup_needed else 1,
+            # CQT 대기: 0=CQT 대기중(우선), 1=일반
+            lot_key[0],
+            # setup 변경 시간 (짧을수록 우선)
+            Dispatchers.get_setup(step, machine, setups),
+            *lot_key[1:],
+        )
 
     @staticmethod
-    def fifo_ptuple_for_lot(lot: Lot, time, machine: Machine = None, setups=None):
+    def fifo_lot_key(lot: Lot):
+        """FIFO ptuple 중 머신과 시간에 의존하지 않는 부분 (대기 중에는 변하지 않음)"""
+        return (
+            0 if lot.cqt_waiting is not None else 1,
+            # 로트 우선순위 (음수이므로 높을수록 앞으로)
+            -lot.priority,
+            # 도착 시간 (FIFO - 먼저 온 것이 작은 값)
+            lot.free_since,
+            # 마감 시간 (보조 기준)
+            lot.deadline_at,
+        )
+
+    @staticmethod
+    def fifo_ptuple_for_lot(lot: Lot, time, machine: Machine = None, instance=None):
         """FIFO: 먼저 도착한 로트 우선
 
         ptuple 구조 (작은 값이 높은 우선순위):
         (min_runs 준수, CQT 대기, setup 시간, 우선순위, 도착시간, 마감시간)
         """
         if machine is not None:
-            lot.ptuple = (
-                # min_runs 제약: 0=준수, 1=위반
-                0 if machine.min_runs_left is None or machine.min_runs_setup == lot.actual_step.setup_needed else 1,
-                # CQT 대기: 0=CQT 대기중(우선), 1=일반
-                0 if lot.cqt_waiting is not None else 1,
-                # setup 변경 시간 (짧을수록 우선)
-                Dispatchers.get_setup(lot.actual_step.setup_needed, machine, lot.actual_step.setup_time, setups),
-                # 로트 우선순위 (음수이므로 높을수록 앞으로)
-                -lot.priority,
-                # 도착 시간 (FIFO - 먼저 온 것이 작은 값)
-                lot.free_since,
-                # 마감 시간 (보조 기준)
-                lot.deadline_at,
-            )
+            lot.ptuple = Dispatchers.machine_ptuple(Dispatchers.fifo_lot_key(lot), machine, lot.actual_step,
+                                                    instance.setup_matrix)
             return lot.ptuple
         else:
             # M4L 모드: 머신 정보 없이 호출
             return -lot.priority, lot.free_since, lot.deadline_at,
 
     @staticmethod
-    def cr_ptuple_for_lot(lot: Lot, time, machine: Machine = None, setups=None):
+    def cr_ptuple_for_lot(lot: Lot, time, machine: Machine = None, instance=None):
         """CR: 긴급한 로트 우선 (Critical Ratio 낮을수록 긴급)
 
         FIFO와 동일하지만 마지막에 free_since 대신 cr(time) 사용
@@ -62,7 +68,7 @@ class Dispatchers:
             lot.ptuple = (
                 0 if machine.min_runs_left is None or machine.min_runs_setup == lot.actual_step.setup_needed else 1,
                 0 if lot.cqt_waiting is not None else 1,
-                Dispatchers.get_setup(lot.actual_step.setup_needed, machine, lot.actual_step.setup_time, setups),
+                Dispatchers.get_setup(lot.actual_step, machine, instance.setup_matrix),
                 -lot.priority,
                 # Critical Ratio (FIFO의 free_since 대신)
                 lot.cr(time),
@@ -72,7 +78,7 @@ class Dispatchers:
             return -lot.priority, lot.cr(time),
 
     @staticmethod
-    def random_ptuple_for_lot(lot: Lot, time, machine: Machine = None, setups=None):
+    def random_ptuple_for_lot(lot: Lot, time, machine: Machine = None, instance=None):
         """Random: 무작위 선택 (벤치마크/비교용)
 
         min_runs와 CQT 제약은 준수하고, 나머지는 랜덤
@@ -81,10 +87,10 @@ class Dispatchers:
             return (
                 0 if machine.min_runs_left is None or machine.min_runs_setup == lot.actual_step.setup_needed else 1,
                 0 if lot.cqt_waiting is not None else 1,
-                r.random.uniform(0, 99999),  # 랜덤 값
+                instance.randomizer.random.uniform(0, 99999),  # 랜덤 값 (인스턴스의 난수원)
             )
         else:
-            return r.random.uniform(0, 99999),
+            return instance.randomizer.random.uniform(0, 99999),
 
 
 # 디스패처 이름 → 함수 매핑
@@ -93,3 +99,9 @@ dispatcher_map = {
     'cr': Dispatchers.cr_ptuple_for_lot,
     'random': Dispatchers.random_ptuple_for_lot,
 }
+
+# 시간에 따라 변하지 않는 디스패처 → lot key 함수 (LotIndex로 증분 정렬 가능)
+# CR, Random은 매 결정마다 전체 재계산
+lot_key_map = {
+    Dispatchers.fifo_ptuple_for_lot: Dispatchers.fifo_lot_key,
+}
@@ -1,27 +1,51 @@
+from collections import defaultdict
+
+from simulation.dispatching.lot_index import LotIndex
+from simulation.dispatching.ready_machines import ReadyMachines
+
 
 class LotForMachineDispatchManager:
 
     @staticmethod
     def init(self):
         self.free_machines = [False for _ in self.machines]
-        self.usable_machines = set()
+        self.usable_machines = ReadyMachines()
+        # lots waiting for any machine of a family share one index, dedicated lots use the machine's index
+        self.waiting_seq = 0
+        self.family_lot_index = defaultdict(LotIndex)
+        # families with batching steps also keep their waiting lots grouped by step name
+        for route in self.routes.values():
+            for step in route.steps:
+                if step.batch_max > 1 and step.family not in self.family_lot_index:
+                    self.family_lot_index[step.family] = LotIndex(batching=True)
+        for machine in self.machines:
+            machine.lot_index = LotIndex(batching=self.family_lot_index[machine.family].groups is not None)
 
     @staticmethod
     def free_up_lots(self, lot):
+        di = lot.actual_step.order
+        dedicated = di in lot.dedications
+        index = None if dedicated else self.family_lot_index[lot.actual_step.family]
+        seq = self.waiting_seq
+        self.waiting_seq += 1
         for machine in self.family_machines[lot.actual_step.family]:
-            di = lot.actual_step.order
-            if di not in lot.dedications or machine.idx == lot.dedications[di]:
-                machine.waiting_lots.append(lot)
+            if not dedicated or machine.idx == lot.dedications[di]:
+                machine.waiting_lots[lot.idx] = lot
                 lot.waiting_machines.append(machine)
+                if dedicated:
+                    index = machine.lot_index
                 if self.free_machines[machine.idx]:
-                    self.usable_machines.add(machine)
+                    self.usable_machines.add(machine, self.current_time)
+        lot.lot_index = index
+        if index is not None:
+            index.add(lot, seq)
 
     @staticmethod
     def free_up_machine(self, machine):
         assert not self.free_machines[machine.idx]
         self.free_machines[machine.idx] = True
         if len(machine.waiting_lots) > 0:
-            self.usable_machines.add(machine)
+            self.usable_machines.add(machine, self.current_time)
 
     @staticmethod
     def reserve(self, lots, machine):
@@ -29,14 +53,67 @@ class LotForMachineDispatchManager:
         self.usable_machines.remove(machine)
         for lot in lots:
             for mx in lot.waiting_machines:
-                mx.waiting_lots.remove(lot)
+                # O(1), waiting_lots is a dict in arrival order
+                del mx.waiting_lots[lot.idx]
                 if len(mx.waiting_lots) == 0 and mx in self.usable_machines:
                     self.usable_machines.remove(mx)
             lot.waiting_machines.clear()
+            if lot.lot_index is not None:
+                lot.lot_index.remove(lot)
+                lot.lot_index = None
+
+    @staticmethod
+    def best_lot(self, machine, lot_key_fcn):
+        # best waiting lot of the machine according to a time invariant dispatcher
+        candidates = [c for c in (self.family_lot_index[machine.family].best(machine, lot_key_fcn, self.setup_matrix),
+                                  machine.lot_index.best(machine, lot_key_fcn, self.setup_matrix)) if c is not None]
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda c: c[:2])[2]
+
+    @staticmethod
+    def batch_groups(self, machine):
+        # waiting lots of a batching machine by step name: step name -> {lot idx: (lot, arrival sequence number)}
+        # of the family and of the machine's dedicated lots, None if the family does not batch
+        groups = self.family_lot_index[machine.family].groups
+        if groups is None:
+            return None
+        dedicated = machine.lot_index.groups
+        merged = {step_name: (group,) for step_name, group in groups.items()}
+        for step_name, group in dedicated.items():
+            merged[step_name] = merged.get(step_name, ()) + (group,)
+        return merged
+
+    @staticmethod
+    def batch_group_heads(self, machine, lot_key_fcn):
+        # step name -> (ptuple, arrival sequence number, lot) of the best lot of each batch group of the machine
+        # according to a time invariant dispatcher
+        heads = self.family_lot_index[machine.family].group_heads(machine, lot_key_fcn, self.setup_matrix)
+        for step_name, candidate in machine.lot_index.group_heads(machine, lot_key_fcn, self.setup_matrix).items():
+            if step_name not in heads or candidate[:2] < heads[step_name][:2]:
+                heads[step_name] = candidate
+        return heads
+
+    @staticmethod
+    def waiting_lots_by_step(self, machine):
+        # waiting lots of the machine grouped by step name, groups and lots in order of arrival
+        groups = LotForMachineDispatchManager.batch_groups(self, machine)
+        if groups is None:
+            by_step = defaultdict(list)
+            for lot in machine.waiting_lots.values():
+                by_step[lot.actual_step.step_name].append(lot)
+            return list(by_step.values())
+        entries = [sorted([e for group in g for e in group.values()], key=lambda e: e[1]) for g in groups.values()]
+        entries.sort(key=lambda es: es[0][1])
+        return [[lot for lot, _ in es] for es in entries]
+
+    @staticmethod
+    def usable_machine_with_setup(self, family, setup_id):
+        # usable machine with the lowest idx of the family that is in setup setup_id, None if there is none
+        return self.usable_machines.with_setup(family, setup_id)
 
     @staticmethod
     def next_decision_point(self):
         while len(self.usable_machines) == 0 and not self.done:
             self.next_step()
         return self.done
-
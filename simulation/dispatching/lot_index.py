@@ -0,0 +1,91 @@
+from heapq import heappush, heappop
+
+from simulation.dispatching.dispatcher import Dispatchers
+
+
+class LotIndex:
+    # Waiting lots of a family (or the lots dedicated to one machine), kept in one heap per setup class
+    # (setup id, step setup time). Within a setup class the machine dependent ptuple components
+    # (min runs, setup time) are equal, so lots can be ordered once by their time invariant lot key.
+    # Removed lots are dropped lazily when they reach the top of a heap.
+    # For batching families the setup class also contains the step name and the waiting lots are kept grouped by
+    # step name, so the head of every batch group is found with one lookup per group.
+
+    def __init__(self, batching=False):
+        self.heaps = {}
+        self.live = {}
+        self.pending = []
+        self.size = 0
+        self.lot_key_fcn = None
+        # step name -> {lot idx: (lot, arrival sequence number)} in arrival order, None if not batching
+        self.groups = {} if batching else None
+
+    def add(self, lot, seq):
+        # lot idx -> (lot, arrival sequence number) of the lots currently waiting
+        self.live[lot.idx] = (lot, seq)
+        self.pending.append((lot, seq))
+        if len(self.pending) > 2 * len(self.live) + 64:
+            self.pending = [e for e in self.pending if self.live.get(e[0].idx) == e]
+        if self.groups is not None:
+            step_name = lot.actual_step.step_name
+            if step_name not in self.groups:
+                self.groups[step_name] = {}
+            self.groups[step_name][lot.idx] = (lot, seq)
+
+    def remove(self, lot):
+        del self.live[lot.idx]
+        if self.groups is not None:
+            group = self.groups[lot.actual_step.step_name]
+            del group[lot.idx]
+            if len(group) == 0:
+                del self.groups[lot.actual_step.step_name]
+
+    def heads(self, machine, lot_key_fcn, setups):
+        # yields (setup class, (ptuple, arrival sequence number, lot)) of the best lot of every setup class
+        live = self.live
+        if lot_key_fcn is not self.lot_key_fcn or self.size > 2 * len(live) + 64:
+            self.lot_key_fcn = lot_key_fcn
+            self.heaps = {}
+            self.size = 0
+            self.pending = list(live.values())
+        for lot, seq in self.pending:
+            if live.get(lot.idx) == (lot, seq):
+                step = lot.actual_step
+                if self.groups is None:
+                    setup_class = (step.setup_id, step.setup_time)
+                else:
+                    setup_class = (step.setup_id, step.setup_time, step.step_name)
+                if setup_class not in self.heaps:
+                    self.heaps[setup_class] = []
+                heappush(self.heaps[setup_class], (lot_key_fcn(lot), seq, lot))
+                self.size += 1
+        self.pending.clear()
+
+        for setup_class in list(self.heaps.keys()):
+            heap = self.heaps[setup_class]
+            while len(heap) > 0 and live.get(heap[0][2].idx) != (heap[0][2], heap[0][1]):
+                heappop(heap)
+                self.size -= 1
+            if len(heap) == 0:
+                del self.heaps[setup_class]
+                continue
+            lot_key, seq, lot = heap[0]
+            yield setup_class, (Dispatchers.machine_ptuple(lot_key, machine, lot.actual_step, setups), seq, lot)
+
+    def best(self, machine, lot_key_fcn, setups):
+        # returns (ptuple, arrival sequence number, lot) of the best lot for the machine or None
+        best = None
+        for _, candidate in self.heads(machine, lot_key_fcn, setups):
+            # the arrival sequence number breaks ties like the stable sort over waiting_lots
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+        return best
+
+    def group_heads(self, machine, lot_key_fcn, setups):
+        # batching only: step name -> (ptuple, arrival sequence number, lot) of the best lot of the batch group
+        best = {}
+        for setup_class, candidate in self.heads(machine, lot_key_fcn, setups):
+            step_name = setup_class[2]
+            if step_name not in best or candidate[:2] < best[step_name][:2]:
+                best[step_name] = candidate
+        return best
@@ -0,0 +1,64 @@
+from collections import defaultdict
+from heapq import heappush, heappop
+
+
+class ReadyMachines:
+    # Usable machines (free, with waiting lots) ordered by (time they became usable, machine idx), so machines are
+    # offered for dispatching in a deterministic order. Removed machines are dropped lazily from the heap.
+
+    def __init__(self):
+        self.heap = []
+        # machine idx -> heap entry (time it became usable, machine idx, push count, machine, (family, setup id)) of
+        # the usable machines
+        self.entries = {}
+        self.pushes = 0
+        # (family, setup id) -> heap of (machine idx, push count) of the usable machines in that setup and their
+        # number, setups only change while a machine is busy
+        self.by_setup = defaultdict(list)
+        self.setup_counts = defaultdict(int)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, machine):
+        return machine.idx in self.entries
+
+    def add(self, machine, time):
+        # a machine that is already usable keeps its place
+        if machine.idx not in self.entries:
+            key = (machine.family, machine.setup_id)
+            entry = (time, machine.idx, self.pushes, machine, key)
+            self.entries[machine.idx] = entry
+            heappush(self.heap, entry)
+            if len(self.heap) > 2 * len(self.entries) + 64:
+                self.heap = sorted(self.entries.values())
+            setup_heap = self.by_setup[key]
+            heappush(setup_heap, (machine.idx, self.pushes))
+            self.setup_counts[key] += 1
+            if len(setup_heap) > 2 * self.setup_counts[key] + 64:
+                self.by_setup[key] = sorted([(e[1], e[2]) for e in self.entries.values() if e[4] == key])
+            self.pushes += 1
+
+    def remove(self, machine):
+        self.setup_counts[self.entries.pop(machine.idx)[4]] -= 1
+
+    @property
+    def first(self):
+        # the machine usable the longest, lowest idx first, None if no machine is usable
+        heap, entries = self.heap, self.entries
+        while len(heap) > 0 and entries.get(heap[0][1]) is not heap[0]:
+            heappop(heap)
+        return heap[0][3] if len(heap) > 0 else None
+
+    def with_setup(self, family, setup_id):
+        # the usable machine with the lowest idx of the family that is in setup setup_id, None if there is none
+        heap = self.by_setup.get((family, setup_id))
+        if heap is None:
+            return None
+        entries = self.entries
+        while len(heap) > 0:
+            entry = entries.get(heap[0][0])
+            if entry is not None and entry[2] == heap[0][1]:
+                return entry[3]
+            heappop(heap)
+        return None
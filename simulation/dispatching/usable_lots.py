@@ -0,0 +1,105 @@
+from bisect import bisect_left, insort
+from itertools import chain, islice
+from operator import itemgetter
+
+PTUPLE = itemgetter(0)
+
+
+class UsableLots:
+    # Lots that can be dispatched to at least one free machine, in dispatch order: the lots scored at the last
+    # decision time sorted by (ptuple, seq), followed by the lots that became usable since then in the order they
+    # became usable. Every lot has one [ptuple, seq, lot] entry, a removed lot leaves its entry behind with lot set
+    # to None until the sorted entries are compacted. Time invariant dispatchers only score the lots that became
+    # usable since the last decision time and insert them into the sorted entries, others score and sort all lots.
+
+    def __init__(self):
+        self.entries = []
+        # entries of the lots added since the last decision time, not scored yet
+        self.unscored = []
+        # lot idx -> entry of the usable lots
+        self.members = {}
+        self.seq = 0
+        self.removed = 0
+        self.sorted_at = None
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, lot):
+        return lot.idx in self.members
+
+    def add(self, lot):
+        entry = [None, self.seq, lot]
+        self.seq += 1
+        self.members[lot.idx] = entry
+        self.unscored.append(entry)
+
+    def remove(self, lot):
+        # O(1), the entry is skipped when the lots are iterated
+        entry = self.members.pop(lot.idx)
+        entry[2] = None
+        if entry[0] is not None:
+            self.removed += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.unscored.clear()
+        self.members.clear()
+        self.removed = 0
+
+    def ordered(self, time, dispatcher, time_invariant, instance):
+        # iterator over the usable lots in dispatch order at time, ptuples as computed by the dispatcher without
+        # machine
+        if self.sorted_at != time:
+            self.sorted_at = time
+            if time_invariant:
+                scored = []
+                for entry in self.unscored:
+                    lot = entry[2]
+                    if lot is not None:
+                        entry[0] = lot.ptuple = dispatcher(lot, time, None, instance)
+                        scored.append(entry)
+                entries = self.entries
+                if len(scored) * 8 > len(entries) or self.removed > len(self.members) + 16:
+                    # few sorted lots (or many removed ones): dropping the removed entries and one sort is cheaper,
+                    # the scored entries have higher seqs so a stable sort by ptuple keeps (ptuple, seq) order
+                    entries = [e for e in entries if e[2] is not None]
+                    entries += scored
+                    entries.sort(key=PTUPLE)
+                    self.entries = entries
+                    self.removed = 0
+                else:
+                    # dispatched lots are mostly at the front, their entries are dropped there
+                    dead = 0
+                    while dead < len(entries) and entries[dead][2] is None:
+                        dead += 1
+                    del entries[:dead]
+                    self.removed -= dead
+                    for entry in scored:
+                        insort(entries, entry)
+            else:
+                # every ptuple changes, equal ptuples keep their order (stable sort) and seq follows the new order
+                entries = [e for e in chain(self.entries, self.unscored) if e[2] is not None]
+                for entry in entries:
+                    lot = entry[2]
+                    entry[0] = lot.ptuple = dispatcher(lot, time, None, instance)
+                entries.sort(key=PTUPLE)
+                for i, entry in enumerate(entries):
+                    entry[1] = i
+                self.entries = entries
+                self.removed = 0
+            self.unscored.clear()
+        return (e[2] for e in chain(self.entries, self.unscored) if e[2] is not None)
+
+    def after(self, lot):
+        # iterator over the usable lots that follow lot in dispatch order
+        entries, unscored = self.entries, self.unscored
+        entry = self.members[lot.idx]
+        if entry[0] is None:
+            # not scored yet, the unscored lots follow the sorted ones
+            start = len(entries) + unscored.index(entry) + 1
+        else:
+            # (ptuple, seq) is unique, the entry is found by bisection
+            start = bisect_left(entries, entry) + 1
+        following = chain(islice(entries, start, None), islice(unscored, max(0, start - len(entries)), None))
+        return (e[2] for e in following if e[2] is not None)
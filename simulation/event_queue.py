@@ -1,40 +1,67 @@
+import heapq
+
+
 class EventQueue:
+    # binary heap of [timestamp, seq, event] entries; seq keeps insertion order for equal timestamps,
+    # cancelled entries stay in the heap as tombstones (event set to None) until they reach the top
     def __init__(self):
-        self.arr = []
+        self.heap = []
+        self.entries = {}
+        self.seq = 0
+        # events popped so far, i.e. handled by the simulation
+        self.handled = 0
 
     @property
     def first(self):
-        return self.arr[0]
+        self._drop_cancelled()
+        return self.heap[0][2]
 
     @property
     def empty(self):
-        return len(self.arr) == 0
+        return len(self.entries) == 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, item):
+        return item in self.entries
 
     def pop_first(self):
-        return self.arr.pop(0)
+        self._drop_cancelled()
+        item = heapq.heappop(self.heap)[2]
+        del self.entries[item]
+        self.handled += 1
+        return item
 
     def push(self, item):
-        self.arr.append(item)
+        self.ordered_insert(item)
 
     def ordered_insert(self, item):
-        if len(self.arr) == 0 or item.timestamp < self.arr[0].timestamp:
-            self.arr.insert(0, item)
-        elif item.timestamp > self.arr[-1].timestamp:
-            self.arr.append(item)
-        else:
-            # binary search - O(log n)
-            lo = 0
-            hi = len(self.arr)
-            while lo < hi:
-                mid = (lo + hi) // 2
-                if item.timestamp < self.arr[mid].timestamp:
-                    hi = mid
-                else:
-                    lo = mid + 1
-            self.arr.insert(lo, item)
+        # O(log n), events with equal timestamps are popped in insertion order
+        entry = [item.timestamp, self.seq, item]
+        self.seq += 1
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
 
     def remove(self, remove):
-        self.arr.remove(remove)
+        # lazy cancellation - O(1)
+        entry = self.entries.pop(remove)
+        entry[2] = None
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self._compact()
+
+    def reschedule(self, item, timestamp):
+        self.remove(item)
+        item.timestamp = timestamp
+        self.ordered_insert(item)
+
+    def _drop_cancelled(self):
+        while self.heap[0][2] is None:
+            heapq.heappop(self.heap)
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if entry[2] is not None]
+        heapq.heapify(self.heap)
 
 
 class LNode:
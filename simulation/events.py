@@ -25,16 +25,15 @@ class ReleaseEvent:
     @staticmethod
     def handle(instance, to_time):
         if to_time is None or (
-                len(instance.dispatchable_lots) > 0 and instance.dispatchable_lots[0].release_at <= to_time):
-            instance.current_time = max(0, instance.dispatchable_lots[0].release_at, instance.current_time)
+                len(instance.dispatchable_lots) > 0 and instance.dispatchable_lots.first.release_at <= to_time):
+            instance.current_time = max(0, instance.dispatchable_lots.first.release_at, instance.current_time)
             lots_released = []
-            while len(instance.dispatchable_lots) > 0 and max(0, instance.dispatchable_lots[
-                0].release_at) <= instance.current_time:
-                lots_released.append(instance.dispatchable_lots[0])
-                instance.dispatchable_lots = instance.dispatchable_lots[1:]
+            while len(instance.dispatchable_lots) > 0 and max(0, instance.dispatchable_lots.first.release_at) <= \
+                    instance.current_time:
+                lots_released.append(instance.dispatchable_lots.pop())
             instance.active_lots += lots_released
             instance.free_up_lots(lots_released)
-            for plugin in instance.plugins:
+            for plugin in instance.hooks.on_lots_release:
                 plugin.on_lots_release(instance, lots_released)
             return True
         else:
@@ -43,7 +42,7 @@ class ReleaseEvent:
 
 class BreakdownEvent:
 
-    def __init__(self, timestamp, length, repeat_interval, machine, is_breakdown):
+    def __init__(self, timestamp, length, repeat_interval, machine, is_breakdown, stream=None, occurrence=0):
         self.timestamp = timestamp
         self.machine = machine
         self.machines = []
@@ -51,25 +50,40 @@ class BreakdownEvent:
         self.is_breakdown = is_breakdown
         self.repeat_interval = repeat_interval
         self.length = length
+        # with common random numbers, the key of this downtime calendar's stream and the number of this downtime
+        self.stream = stream
+        self.occurrence = occurrence
+        # sampled length of the downtime once it started
+        self.downtime = None
         if not is_breakdown:
             machine.next_preventive_maintenance = timestamp
 
     def handle(self, instance):
-        length = self.length.sample()
+        if self.stream is None:
+            length, interval = self.length.sample(instance.randomizer), None
+        else:
+            u = instance.randomizer.uniforms(2, 'downtime', *self.stream, self.occurrence)
+            length, interval = self.length.sample_from(u[0]), self.repeat_interval.sample_from(u[1])
         if self.is_breakdown:
             self.machine.bred_time += length
         else:
             self.machine.pmed_time += length
         instance.handle_breakdown(self.machine, length)
-        for plugin in instance.plugins:
-            if self.is_breakdown:
+        self.downtime = length
+        if self.is_breakdown:
+            for plugin in instance.hooks.on_breakdown:
                 plugin.on_breakdown(instance, self)
-            else:
+        else:
+            for plugin in instance.hooks.on_preventive_maintenance:
                 plugin.on_preventive_maintenance(instance, self)
+        if interval is None:
+            interval = self.repeat_interval.sample(instance.randomizer)
         instance.add_event(BreakdownEvent(
-            self.timestamp + length + self.repeat_interval.sample(),
+            self.timestamp + length + interval,
             self.length,
             self.repeat_interval,
             self.machine,
             self.is_breakdown,
+            self.stream,
+            self.occurrence + 1,
         ))
@@ -3,21 +3,37 @@ from typing import Dict, List
 from simulation.classes import Machine, FileRoute, Lot
 from simulation.events import BreakdownEvent
 from simulation.instance import Instance
+from simulation.release_queue import OrderReleases, ListReleases, LotReleaseQueue
 from simulation.randomizer import Randomizer
 from simulation.tools import get_interval, get_distribution, UniformDistribution, date_time_parse
 
 
+def release_count(repeats, release_interval, run_to):
+    # lots of an order: repetitions up to and including the first one released after run_to
+    if release_interval <= 0:
+        return repeats
+    first_release = 0
+    count = max(0, int((run_to - first_release) // release_interval))
+    while count > 0 and first_release + (count - 1) * release_interval > run_to:
+        count -= 1
+    while first_release + count * release_interval <= run_to:
+        count += 1
+    return min(repeats, count + 1)
+
+
 class FileInstance(Instance):
 
-    def __init__(self, files: Dict[str, List[Dict]], run_to, lot_for_machine, plugins):
+    def __init__(self, files: Dict[str, List[Dict]], run_to, lot_for_machine, plugins, keep_done_lots=True,
+                 randomizer=None):
+        r = randomizer if randomizer is not None else Randomizer()
         machines = []
         machine_id = 0
-        r = Randomizer()
+        machine_classes = {}
         family_locations = {}
         for d_m in files['tool.txt.1l']:
             for i in range(int(d_m['STNQTY'])):
                 speed = 1  # r.random.uniform(0.7, 1.3)
-                m = Machine(idx=machine_id, d=d_m, speed=speed)
+                m = Machine(idx=machine_id, d=d_m, speed=speed, machine_classes=machine_classes)
                 family_locations[m.family] = m.loc
                 machines.append(m)
                 machine_id += 1
@@ -41,33 +57,33 @@ class FileInstance(Instance):
 
         parts = {p['PART']: p['ROUTEFILE'] for p in files['part.txt']}
 
-        lots = []
+        streams = []
         idx = 0
         lot_pre = {}
         for order in files['order.txt']:
             assert pieces == order['PIECES']
-            first_release = 0
             release_interval = get_interval(order['REPEAT'], order['RUNITS'])
             relative_deadline = (date_time_parse(order['DUE']) - date_time_parse(order['START'])).total_seconds()
 
-            for i in range(order['RPT#']):
-                rel_time = first_release + i * release_interval
-                lot = Lot(idx, routes[parts[order['PART']]], order['PRIOR'], rel_time, relative_deadline, order)
-                lots.append(lot)
-                lot_pre[lot.name] = relative_deadline
-                idx += 1
-                if rel_time > run_to:
-                    break
+            count = release_count(order['RPT#'], release_interval, run_to)
+            streams.append(OrderReleases(idx, count, routes[parts[order['PART']]], order['PRIOR'], release_interval,
+                                         relative_deadline, order))
+            if count > 0:
+                lot_pre[Lot.product_name(order['LOT'])] = relative_deadline
+            idx += count
 
+        wip_lots = []
         for wip in files['WIP.txt']:
             assert pieces == wip['PIECES']
             first_release = 0
             relative_deadline = (date_time_parse(wip['DUE']) - date_time_parse(wip['START'])).total_seconds()
             if wip['CURSTEP'] < len(routes[parts[wip['PART']]].steps) - 1:
                 lot = Lot(idx, routes[parts[wip['PART']]], wip['PRIOR'], first_release, relative_deadline, wip)
-                lots.append(lot)
+                wip_lots.append(lot)
                 lot.release_at = lot.deadline_at - lot_pre[lot.name]
             idx += 1
+        streams.append(ListReleases(wip_lots))
+        lots = LotReleaseQueue(streams)
 
         setups = {(s['CURSETUP'], s['NEWSETUP']): get_interval(s['STIME'], s['STUNITS']) for s in files['setup.txt']}
         setup_min_run = {s['SETUP']: s['MINRUN'] for s in files['setupgrp.txt']}
@@ -82,7 +98,7 @@ class FileInstance(Instance):
                                        get_distribution(dc['MTTRDIST'], dc['MTTRUNITS'], dc['MTTR'], dc['MTTR2']))
 
         breakdowns = []
-        for a in files['attach.txt']:
+        for calendar, a in enumerate(files['attach.txt']):
             if a['RESTYPE'] == 'stngrp':
                 m_break = [m for m in machines if m.group == a['RESNAME']]
             else:
@@ -103,9 +119,14 @@ class FileInstance(Instance):
                     m.maintenance_time.append(le)
             else:
                 for m in m_break:
-                    br = BreakdownEvent(distribution.sample(), le, ne, m, is_breakdown)
+                    if r.crn_seed is None:
+                        br = BreakdownEvent(distribution.sample(r), le, ne, m, is_breakdown)
+                    else:
+                        first = distribution.sample_from(r.uniforms(1, 'downtime', m.idx, calendar, 'first')[0])
+                        br = BreakdownEvent(first, le, ne, m, is_breakdown, (m.idx, calendar))
                     if not is_breakdown:
                         m.pms.append(br)
                     breakdowns.append(br)
 
-        super().__init__(machines, routes, lots, setups, setup_min_run, breakdowns, lot_for_machine, plugins)
+        super().__init__(machines, routes, lots, setups, setup_min_run, breakdowns, lot_for_machine, plugins,
+                         keep_done_lots, r)
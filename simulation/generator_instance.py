@@ -4,14 +4,12 @@ from typing import Dict, List
 from simulation.classes import Machine, FileRoute, Lot, Step, Route
 from simulation.events import BreakdownEvent
 from simulation.instance import Instance
-from simulation.randomizer import Randomizer
+from simulation.randomizer import Randomizer, RandomSource
 from simulation.tools import get_interval, get_distribution, UniformDistribution, date_time_parse
 
-r = Randomizer()
-
 
 class GeneratorRoute(Route):
-    def __init__(self, idx, steps: int):
+    def __init__(self, idx, steps: int, r: RandomSource):
         fams = [r.random.choice(['S1', 'S2', 'S3', 'S4', 'B1', 'B2', 'B3',
                                  'C1', 'C2']) for i in range(steps)]
         steps = [Step(i, {
@@ -39,11 +37,12 @@ class GeneratorRoute(Route):
 
 class GeneratorInstance(Instance):
 
-    def __init__(self, run_to):
+    def __init__(self, run_to, randomizer=None):
         print('New instance generated')
         machines = []
         machine_id = 0
-        r = Randomizer()
+        r = randomizer if randomizer is not None else Randomizer()
+        machine_classes = {}
         family_locations = {}
         for group, family, quantity, cascading in [
             ('Simple', 'S1', 4, 1),
@@ -67,7 +66,7 @@ class GeneratorInstance(Instance):
                     'STNFAMLOC': 'Fab',
                     'STNFAM': family,
                     'STNCAP': cascading,
-                }, speed=speed)
+                }, speed=speed, machine_classes=machine_classes)
                 family_locations[m.family] = m.loc
                 machines.append(m)
                 machine_id += 1
@@ -76,7 +75,7 @@ class GeneratorInstance(Instance):
 
         routes = {}
         for rk in range(5):
-            route = GeneratorRoute(rk, 10)
+            route = GeneratorRoute(rk, 10, r)
             last_loc = None
             for s in route.steps:
                 s.family_location = family_locations[s.family]
@@ -111,4 +110,4 @@ class GeneratorInstance(Instance):
 
         setups = {('Setup1', 'Setup2'): 1200, ('Setup1', 'Setup2'): 2400}
 
-        super().__init__(machines, routes, lots, setups, [])
+        super().__init__(machines, routes, lots, setups, [], randomizer=r)
@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+from simulation.dispatching.dispatcher import dispatcher_map
+from simulation.file_instance import FileInstance
+from simulation.greedy import simulate
+from simulation.plugins.cost_plugin import CostPlugin
+from simulation.plugins.interface import IPlugin
+from simulation.randomizer import Randomizer
+from simulation.read import read_all
+from simulation.stats import print_statistics
+
+# decisions per digest block, a divergence is first located to a block
+BLOCK_SIZE = 1000
+
+
+class DigestPlugin(IPlugin):
+    # hashes every dispatch decision (time, machine idx, lot idxs) in blocks of BLOCK_SIZE decisions
+
+    def __init__(self, keep_trace=False):
+        self.blocks = []
+        self.block_times = []
+        self.decisions = 0
+        self.hash = hashlib.sha1()
+        self.trace = [] if keep_trace else None
+
+    def on_dispatch(self, instance, machine, lots, machine_end_time, lot_end_time):
+        decision = f'{instance.current_time!r} {machine.idx} {",".join([str(lot.idx) for lot in lots])}'
+        if self.decisions % BLOCK_SIZE == 0:
+            self.block_times.append(instance.current_time)
+        self.hash.update(decision.encode() + b'\n')
+        self.decisions += 1
+        if self.decisions % BLOCK_SIZE == 0:
+            self.close_block()
+        if self.trace is not None:
+            self.trace.append(decision)
+
+    def close_block(self):
+        self.blocks.append(self.hash.hexdigest())
+        self.hash = hashlib.sha1()
+
+    def on_sim_done(self, instance):
+        if self.decisions % BLOCK_SIZE != 0:
+            self.close_block()
+
+
+def case_name(case):
+    dataset, dispatcher, seed, days, alg = case
+    return f'{dataset}_{dispatcher}_seed{seed}_{days}days_{alg}'
+
+
+def run_case(case, keep_trace):
+    dataset, dispatcher, seed, days, alg = case
+    run_to = 3600 * 24 * days
+    Randomizer().random.seed(seed)
+    l4m = alg == 'l4m'
+    digest = DigestPlugin(keep_trace)
+    instance = FileInstance(read_all('datasets/' + dataset), run_to, l4m, [digest, CostPlugin()])
+    simulate(instance, dispatcher_map[dispatcher], run_to, l4m, progress=False)
+    instance.finalize()
+    out = io.StringIO()
+    with tempfile.TemporaryDirectory() as d, contextlib.redirect_stdout(out):
+        print_statistics(instance, days, dataset, dispatcher, dir=d)
+        with io.open(os.path.join(d, os.listdir(d)[0]), 'r') as f:
+            statistics_json = f.read()
+    result = {
+        'decisions': digest.decisions,
+        'blocks': digest.blocks,
+        'block_times': digest.block_times,
+        'statistics': hashlib.sha1((out.getvalue() + statistics_json).encode()).hexdigest(),
+    }
+    return result, digest.trace
+
+
+def trace_path(golden, case):
+    return os.path.join(os.path.splitext(golden)[0] + '_traces', case_name(case) + '.txt.gz')
+
+
+def record(cases, golden, keep_trace):
+    out = {'block_size': BLOCK_SIZE, 'cases': {}}
+    for case in cases:
+        result, trace = run_case(case, keep_trace)
+        out['cases'][case_name(case)] = dict(case=case, **result)
+        if keep_trace:
+            os.makedirs(os.path.dirname(trace_path(golden, case)), exist_ok=True)
+            with gzip.open(trace_path(golden, case), 'wt') as f:
+                f.write('\n'.join(trace) + '\n')
+        sys.stderr.write(f'{case_name(case)}: {result["decisions"]} decisions recorded\n')
+    os.makedirs(os.path.dirname(golden) or '.', exist_ok=True)
+    with io.open(golden, 'w') as f:
+        json.dump(out, f, indent=1)
+
+
+def first_divergence(expected, actual):
+    # index of the first differing block, None if all blocks match
+    for i in range(max(len(expected['blocks']), len(actual['blocks']))):
+        if i >= len(expected['blocks']) or i >= len(actual['blocks']) or \
+                expected['blocks'][i] != actual['blocks'][i]:
+            return i
+    return None
+
+
+def report_divergence(golden, case, expected, block, trace):
+    start = block * BLOCK_SIZE
+    print(f'{case_name(case)}: DIVERGED in decisions {start}..{start + BLOCK_SIZE - 1}')
+    if block < len(expected['block_times']):
+        print(f'  block starts at t={expected["block_times"][block]} in the golden run')
+    path = trace_path(golden, case)
+    if not os.path.exists(path):
+        print('  no golden trace stored, record with --trace to see the decision')
+        return
+    with gzip.open(path, 'rt') as f:
+        golden_trace = f.read().splitlines()
+    for i in range(start, max(len(golden_trace), len(trace))):
+        old = golden_trace[i] if i < len(golden_trace) else '<none>'
+        new = trace[i] if i < len(trace) else '<none>'
+        if old != new:
+            print(f'  decision {i} (time machine lots)\n    golden: {old}\n    now:    {new}')
+            return
+
+
+def verify(golden):
+    with io.open(golden, 'r') as f:
+        recorded = json.load(f)
+    assert recorded['block_size'] == BLOCK_SIZE
+    failed = 0
+    for name, expected in recorded['cases'].items():
+        case = tuple(expected['case'])
+        actual, trace = run_case(case, keep_trace=True)
+        block = first_divergence(expected, actual)
+        if block is not None:
+            failed += 1
+            report_divergence(golden, case, expected, block, trace)
+        elif actual['statistics'] != expected['statistics']:
+            failed += 1
+            print(f'{name}: same decisions, but the statistics output differs')
+        else:
+            print(f'{name}: OK ({actual["decisions"]} decisions)')
+    return failed
+
+
+def main():
+    p = argparse.ArgumentParser(description='Records or verifies digests of seeded dispatch decisions and statistics')
+    p.add_argument('command', choices=['record', 'verify'])
+    p.add_argument('--golden', type=str, default='golden/golden.json')
+    p.add_argument('--datasets', type=str, nargs='+', default=['SMT2020_HVLM', 'SMT2020_LVHM'])
+    p.add_argument('--dispatchers', type=str, nargs='+', default=['fifo', 'cr'], choices=list(dispatcher_map.keys()))
+    p.add_argument('--seeds', type=int, nargs='+', default=[0])
+    p.add_argument('--days', type=int, default=5)
+    p.add_argument('--algs', type=str, nargs='+', default=['l4m', 'm4l'], choices=['l4m', 'm4l'])
+    p.add_argument('--trace', action='store_true', default=False,
+                   help='also store the full decision traces to pinpoint the first differing decision')
+    a = p.parse_args()
+    if a.command == 'record':
+        cases = [(dataset, dispatcher, seed, a.days, alg)
+                 for dataset in a.datasets for dispatcher in a.dispatchers for seed in a.seeds for alg in a.algs]
+        record(cases, a.golden, a.trace)
+    elif verify(a.golden) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
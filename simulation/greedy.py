@@ -1,59 +1,77 @@
 import os
 import sys
-from collections import defaultdict
 from datetime import datetime
+from heapq import nsmallest
 from typing import List
 
-from simulation.classes import Lot, Machine
-from simulation.dispatching.dispatcher import dispatcher_map
+from simulation.checkpoint import Checkpoints, load_checkpoint
+from simulation.classes import Lot
+from simulation.dispatching.dispatcher import dispatcher_map, lot_key_map
 from simulation.file_instance import FileInstance
 from simulation.plugins.cost_plugin import CostPlugin
+from simulation.plugins.statistics_plugin import StatisticsPlugin
 from simulation.randomizer import Randomizer
 from simulation.read import read_all
+from simulation.result_store import write_run
 from simulation.stats import print_statistics
 
 import argparse
 
-last_sort_time = -1
-
-
-def dispatching_combined_permachine(ptuple_fcn, machine, time, setups):
-    for lot in machine.waiting_lots:
-        lot.ptuple = ptuple_fcn(lot, time, machine, setups)
+def dispatching_combined_permachine(ptuple_fcn, machine, time, instance):
+    for lot in machine.waiting_lots.values():
+        lot.ptuple = ptuple_fcn(lot, time, machine, instance)
 
 
 def get_lots_to_dispatch_by_machine(instance, ptuple_fcn, machine=None):
     """머신 기준으로 디스패칭할 로트 선택 (L4M 방식)"""
     time = instance.current_time
     if machine is None:
-        for machine in instance.usable_machines:
-            break
-    # 대기 중인 모든 로트의 우선순위 튜플(ptuple) 계산
-    dispatching_combined_permachine(ptuple_fcn, machine, time, instance.setups)
-    # ptuple 기준으로 정렬 (작은 값 = 높은 우선순위)
-    wl = sorted(machine.waiting_lots, key=lambda k: k.ptuple)
-    # 가장 높은 우선순위 로트 선택
-    lot = wl[0]
+        machine = instance.usable_machines.first
+    lot = None
+    # 시간 불변 디스패처는 패밀리/머신별 증분 인덱스에서 최우선 로트를 바로 조회
+    lot_key_fcn = lot_key_map.get(ptuple_fcn)
+    if lot_key_fcn is not None:
+        lot = instance.dm.best_lot(instance, machine, lot_key_fcn)
+    if lot is None:
+        lot_key_fcn = None
+        # 대기 중인 모든 로트의 우선순위 튜플(ptuple) 계산
+        dispatching_combined_permachine(ptuple_fcn, machine, time, instance)
+        # 가장 높은 우선순위 로트 선택 (작은 값 = 높은 우선순위, 동률이면 먼저 대기한 로트)
+        lot = min(machine.waiting_lots.values(), key=lambda k: k.ptuple)
 
     # ========== 배치 처리 로직 ==========
     if lot.actual_step.batch_max > 1:
-        # 같은 step_name끼리 그룹핑 (배치로 묶을 수 있는 로트들)
-        lot_m = defaultdict(lambda: [])
-        for w in wl:
-            lot_m[w.actual_step.step_name].append(w)
-        # 그룹별 우선순위 정렬
-        lot_l = sorted(list(lot_m.values()),
-                       key=lambda l: (
-                           l[0].ptuple[0],  # CQT 대기 중인 로트 우선
-                           l[0].ptuple[1],  # min_runs 제약 준수 우선
-                           -min(1, len(l) / l[0].actual_step.batch_max),  # 배치 채움률 높은 것 우선 (음수라서 큰 값이 앞으로)
-                           0 if len(l) >= l[0].actual_step.batch_min else 1,  # batch_min 충족하는 것 우선
-                           *(l[0].ptuple[2:]),  # 나머지는 기본 우선순위 규칙 따름
-                       ))
-        lots: List[Lot] = lot_l[0]  # 가장 우선순위 높은 그룹 선택
-        # batch_max 초과 시 잘라냄
-        if len(lots) > lots[0].actual_step.batch_max:
-            lots = lots[:lots[0].actual_step.batch_max]
+        # 같은 step_name끼리의 그룹 (배치로 묶을 수 있는 로트들)은 인덱스에서 로트 도착/예약 시 갱신됨
+        groups = instance.dm.batch_groups(instance, machine)
+        # 그룹 대표 로트 = 그룹 내 최우선 로트 (ptuple, 도착 순번, 로트)
+        if lot_key_fcn is not None:
+            heads = instance.dm.batch_group_heads(instance, machine, lot_key_fcn)
+        else:
+            heads = {step_name: min([(l.ptuple, seq, l) for group in g for l, seq in group.values()],
+                                    key=lambda c: c[:2])
+                     for step_name, g in groups.items()}
+        # 그룹별 우선순위 비교 (동률이면 대표 로트가 먼저 대기한 그룹)
+        best = None
+        for step_name, (ptuple, seq, head) in heads.items():
+            count = sum([len(group) for group in groups[step_name]])
+            key = (
+                ptuple[0],  # CQT 대기 중인 로트 우선
+                ptuple[1],  # min_runs 제약 준수 우선
+                -min(1, count / head.actual_step.batch_max),  # 배치 채움률 높은 것 우선 (음수라서 큰 값이 앞으로)
+                0 if count >= head.actual_step.batch_min else 1,  # batch_min 충족하는 것 우선
+                *(ptuple[2:]),  # 나머지는 기본 우선순위 규칙 따름
+                seq,
+            )
+            if best is None or key < best[0]:
+                best = (key, step_name, head)
+        _, step_name, head = best
+        # 가장 우선순위 높은 그룹에서 ptuple 순으로 최대 batch_max개 선택
+        entries = [e for group in groups[step_name] for e in group.values()]
+        if lot_key_fcn is not None:
+            for l, _ in entries:
+                l.ptuple = ptuple_fcn(l, time, machine, instance)
+        lots: List[Lot] = [l for l, _ in nsmallest(head.actual_step.batch_max, entries,
+                                                   key=lambda e: (e[0].ptuple, e[1]))]
         # batch_min 미만이면 처리 안함 (더 모일 때까지 대기)
         if len(lots) < lots[0].actual_step.batch_min:
             lots = None
@@ -63,12 +81,11 @@ def get_lots_to_dispatch_by_machine(instance, ptuple_fcn, machine=None):
 
     # ========== Setup 최적화 ==========
     # 현재 머신의 setup과 로트의 setup이 다르면, 같은 setup을 가진 다른 머신 찾기
-    if lots is not None and machine.current_setup != lots[0].actual_step.setup_needed:
-        m: Machine
-        for m in instance.family_machines[machine.family]:
-            if m in instance.usable_machines and m.current_setup == lots[0].actual_step.setup_needed:
-                machine = m  # setup 변경 없이 처리 가능한 머신으로 교체
-                break
+    if lots is not None and machine.setup_id != lots[0].actual_step.setup_id:
+        # (패밀리, setup)별 사용 가능 머신 힙에서 같은 setup의 머신 중 idx가 가장 작은 것을 바로 조회
+        m = instance.dm.usable_machine_with_setup(instance, machine.family, lots[0].actual_step.setup_id)
+        if m is not None:
+            machine = m  # setup 변경 없이 처리 가능한 머신으로 교체
 
     # ========== min_runs 제약 처리 ==========
     # min_runs_left가 남아있는데 다른 setup 로트를 처리하려 하면 거부 (최대 5회까지)
@@ -95,75 +112,39 @@ def build_batch(lot, nexts):
 
 
 def get_lots_to_dispatch_by_lot(instance, current_time, dispatcher):
-    global last_sort_time
-    if last_sort_time != current_time:
-        for lot in instance.usable_lots:
-            lot.ptuple = dispatcher(lot, current_time, None)
-        last_sort_time = current_time
-        instance.usable_lots.sort(key=lambda k: k.ptuple)
-    lots = instance.usable_lots
-    setup_machine, setup_batch = None, None
-    min_run_break_machine, min_run_break_batch = None, None
+    # 시각이 바뀔 때만 재정렬, 시간 불변 디스패처는 새로 사용 가능해진 로트만 점수 계산
+    lots = instance.usable_lots.ordered(current_time, dispatcher, dispatcher in lot_key_map, instance)
+    setup_machine, setup_lot = None, None
+    min_run_break_machine, min_run_break_lot = None, None
     family_lock = None
-    for i in range(len(lots)):
-        lot: Lot = lots[i]
+    for lot in lots:
         if family_lock is None or family_lock == lot.actual_step.family:
             family_lock = lot.actual_step.family
             assert len(lot.waiting_machines) > 0
             for machine in lot.waiting_machines:
                 if lot.actual_step.setup_needed == '' or lot.actual_step.setup_needed == machine.current_setup:
-                    return machine, build_batch(lot, lots[i + 1:])
+                    # lots는 이터레이터라 lot 다음 로트부터 이어서 배치를 구성
+                    return machine, build_batch(lot, lots)
                 else:
                     if setup_machine is None and machine.min_runs_left is None:
                         setup_machine = machine
-                        setup_batch = i
+                        setup_lot = lot
                     if min_run_break_machine is None:
                         min_run_break_machine = machine
-                        min_run_break_batch = i
+                        min_run_break_lot = lot
     if setup_machine is not None:
-        return setup_machine, build_batch(lots[setup_batch], lots[setup_batch + 1:])
-    return min_run_break_machine, build_batch(lots[min_run_break_batch], lots[min_run_break_batch + 1:])
-
-
-def run_greedy():
-    p = argparse.ArgumentParser()
-    p.add_argument('--dataset', type=str)
-    p.add_argument('--days', type=int)
-    p.add_argument('--dispatcher', type=str)
-    p.add_argument('--seed', type=int)
-    p.add_argument('--wandb', action='store_true', default=False)
-    p.add_argument('--chart', action='store_true', default=False)
-    p.add_argument('--alg', type=str, default='l4m', choices=['l4m', 'm4l'])
-    a = p.parse_args()
-
-    sys.stderr.write('Loading ' + a.dataset + ' for ' + str(a.days) + ' days, using ' + a.dispatcher + '\n')
-    sys.stderr.flush()
-
-    start_time = datetime.now()
-
-    files = read_all('datasets/' + a.dataset)
-
-    run_to = 3600 * 24 * a.days
-    Randomizer().random.seed(a.seed)
-    l4m = a.alg == 'l4m'
-    plugins = []
-    if a.wandb:
-        from simulation.plugins.wandb_plugin import WandBPlugin
-        plugins.append(WandBPlugin())
-    if a.chart:
-        from simulation.plugins.chart_plugin import ChartPlugin
-        plugins.append(ChartPlugin())
-    plugins.append(CostPlugin())
-    instance = FileInstance(files, run_to, l4m, plugins)
-
-    dispatcher = dispatcher_map[a.dispatcher]
+        return setup_machine, build_batch(setup_lot, instance.usable_lots.after(setup_lot))
+    return min_run_break_machine, build_batch(min_run_break_lot, instance.usable_lots.after(min_run_break_lot))
 
-    sys.stderr.write('Starting simulation with dispatching rule\n\n')
-    sys.stderr.flush()
 
+def simulate(instance, dispatcher, run_to, l4m, progress=True, checkpoints=None):
     while not instance.done:
+        # 결정 시점 사이(디스패치 직후)에만 체크포인트를 기록하므로 재개한 실행이 같은 지점에서 이어짐
+        if checkpoints is not None:
+            checkpoints.maybe_save(instance)
         done = instance.next_decision_point()
-        instance.print_progress_in_days()
+        if progress:
+            instance.print_progress_in_days()
         if done or instance.current_time > run_to:
             break
 
@@ -177,12 +158,94 @@ def run_greedy():
             machine, lots = get_lots_to_dispatch_by_lot(instance, instance.current_time, dispatcher)
             if lots is None:
                 instance.usable_lots.clear()
-                instance.lot_in_usable.clear()
                 instance.next_step()
             else:
                 instance.dispatch(machine, lots)
 
-    instance.finalize()
-    interval = datetime.now() - start_time
-    print(instance.current_time_days, ' days simulated in ', interval)
-    print_statistics(instance, a.days, a.dataset, a.dispatcher, method='greedy_seed' + str(a.seed))
+
+def run_greedy():
+    p = argparse.ArgumentParser()
+    p.add_argument('--dataset', type=str)
+    p.add_argument('--days', type=int)
+    p.add_argument('--dispatcher', type=str)
+    p.add_argument('--seed', type=int)
+    p.add_argument('--wandb', action='store_true', default=False)
+    p.add_argument('--chart', action='store_true', default=False)
+    p.add_argument('--alg', type=str, default='l4m', choices=['l4m', 'm4l'])
+    p.add_argument('--trace', type=str, default=None,
+                   help='write dispatches, lot and machine events, downtimes and releases to this binary trace file')
+    p.add_argument('--drop-done-lots', action='store_true', default=False,
+                   help='keep only streaming statistics of finished lots, not the lots themselves')
+    p.add_argument('--crn', action='store_true', default=False,
+                   help='common random numbers: the same fab randomness for every dispatcher with this seed')
+    p.add_argument('--report-days', type=int, nargs='+', default=[],
+                   help='also write statistics after this many simulated days, from the same run')
+    p.add_argument('--store', type=str, default=None,
+                   help='also add the lot completions and machine time accounting of every report to this SQLite '
+                        'result store')
+    p.add_argument('--checkpoint-every', type=float, default=None,
+                   help='write a checkpoint of the simulation every this many simulated days')
+    p.add_argument('--checkpoint', type=str, default='checkpoint.pkl.gz', help='checkpoint file')
+    p.add_argument('--resume', type=str, default=None,
+                   help='continue the run saved in this checkpoint file, with the arguments it was started with')
+    a = p.parse_args()
+
+    start_time = datetime.now()
+
+    if a.resume is not None:
+        instance, saved = load_checkpoint(a.resume)
+        # checkpointing of the resumed run is set on this command line, everything else comes from the checkpoint
+        a = argparse.Namespace(**dict(vars(saved), resume=a.resume, checkpoint=a.checkpoint,
+                                      checkpoint_every=a.checkpoint_every))
+        sys.stderr.write('Resuming ' + a.dataset + ' from ' + a.resume + ' at day ' +
+                         str(round(instance.current_time_days, 1)) + ', using ' + a.dispatcher + '\n')
+        sys.stderr.flush()
+        l4m = a.alg == 'l4m'
+    else:
+        sys.stderr.write('Loading ' + a.dataset + ' for ' + str(a.days) + ' days, using ' + a.dispatcher + '\n')
+        sys.stderr.flush()
+
+        files = read_all('datasets/' + a.dataset)
+
+        run_to = 3600 * 24 * a.days
+        Randomizer().seed(a.seed, a.crn)
+        l4m = a.alg == 'l4m'
+        plugins = []
+        if a.wandb:
+            from simulation.plugins.wandb_plugin import WandBPlugin
+            plugins.append(WandBPlugin())
+        if a.chart:
+            from simulation.plugins.chart_plugin import ChartPlugin
+            plugins.append(ChartPlugin())
+        if a.trace is not None:
+            from simulation.plugins.trace_plugin import TracePlugin
+            plugins.append(TracePlugin(a.trace))
+        plugins.append(CostPlugin())
+        # the store takes the completions from instance.done_lots unless those are dropped
+        plugins.append(StatisticsPlugin(keep_completions=a.store is not None and a.drop_done_lots))
+        instance = FileInstance(files, run_to, l4m, plugins, keep_done_lots=not a.drop_done_lots)
+
+    dispatcher = dispatcher_map[a.dispatcher]
+    checkpoints = None
+    if a.checkpoint_every is not None:
+        checkpoints = Checkpoints(a.checkpoint, 3600 * 24 * a.checkpoint_every, args=a)
+
+    # report horizons in days, a resumed run skips the ones reported before the checkpoint
+    horizons = sorted(set([d for d in getattr(a, 'report_days', []) if d < a.days] + [a.days]))
+    horizons = [d for d in horizons if 3600 * 24 * d >= instance.current_time]
+
+    sys.stderr.write('Starting simulation with dispatching rule\n\n')
+    sys.stderr.flush()
+
+    for days in horizons:
+        # the simulation stops at the first decision point after the horizon and continues from there, so every
+        # report equals the one of a run of that many days
+        simulate(instance, dispatcher, 3600 * 24 * days, l4m, checkpoints=checkpoints)
+
+        if days == a.days:
+            instance.finalize()
+        interval = datetime.now() - start_time
+        print(instance.current_time_days, ' days simulated in ', interval)
+        print_statistics(instance, days, a.dataset, a.dispatcher, method='greedy_seed' + str(a.seed))
+        if getattr(a, 'store', None) is not None:
+            write_run(a.store, instance, 'greedy', a.dataset, a.dispatcher, a.seed, days)
@@ -0,0 +1,120 @@
+import numpy as np
+
+from simulation.gym.E import E
+
+OT = E.A.L4M.S.OPERATION_TYPE
+MACHINE = E.A.L4M.S.MACHINE
+
+FREE_SINCE_COMPONENTS = {OT.FREE_SINCE.MIN, OT.FREE_SINCE.MEAN, OT.FREE_SINCE.MEDIAN, OT.FREE_SINCE.MAX}
+STEPS_LEFT_COMPONENTS = {OT.STEPS_LEFT.MIN, OT.STEPS_LEFT.MEAN, OT.STEPS_LEFT.MEDIAN, OT.STEPS_LEFT.MAX}
+PRIORITY_COMPONENTS = {OT.PRIORITY.MIN, OT.PRIORITY.MEAN, OT.PRIORITY.MEDIAN, OT.PRIORITY.MAX}
+CR_COMPONENTS = {OT.CR.MIN, OT.CR.MEAN, OT.CR.MEDIAN, OT.CR.MAX}
+
+EMPTY_ACTION = -1000
+
+
+class GroupedLots:
+    # attributes of the lots of all action groups in contiguous arrays, lots of one group are adjacent
+
+    def __init__(self, groups, t, needed):
+        lots = [lot for group in groups for lot in group]
+        n = len(lots)
+        self.sizes = np.fromiter((len(group) for group in groups), dtype=np.int64, count=len(groups))
+        self.starts = np.zeros(len(groups), dtype=np.int64)
+        np.cumsum(self.sizes[:-1], out=self.starts[1:])
+        self.group_ids = np.repeat(np.arange(len(groups)), self.sizes)
+        self.first_steps = [group[0].actual_step for group in groups]
+        self.arrays = {}
+        if needed & FREE_SINCE_COMPONENTS:
+            self.arrays['free_since'] = t - np.fromiter((l.free_since for l in lots), dtype=np.float64, count=n)
+        if needed & STEPS_LEFT_COMPONENTS:
+            self.arrays['steps_left'] = np.fromiter((l.steps_left for l in lots), dtype=np.float64, count=n)
+        if needed & PRIORITY_COMPONENTS:
+            self.arrays['priority'] = np.fromiter((l.priority for l in lots), dtype=np.float64, count=n)
+        if needed & CR_COMPONENTS:
+            deadline = np.fromiter((l.deadline_at for l in lots), dtype=np.float64, count=n)
+            rt = np.fromiter((l.remaining_time for l in lots), dtype=np.float64, count=n)
+            positive = rt > 0
+            self.arrays['cr'] = np.where(positive, (deadline - t) / np.where(positive, rt, 1), 1)
+
+    def min(self, name):
+        return np.minimum.reduceat(self.arrays[name], self.starts)
+
+    def max(self, name):
+        return np.maximum.reduceat(self.arrays[name], self.starts)
+
+    def mean(self, name):
+        return np.add.reduceat(self.arrays[name], self.starts) / self.sizes
+
+    def median(self, name):
+        values = self.arrays[name]
+        ordered = values[np.lexsort((values, self.group_ids))]
+        return (ordered[self.starts + (self.sizes - 1) // 2] + ordered[self.starts + self.sizes // 2]) / 2
+
+    def per_step(self, fcn):
+        return np.fromiter((fcn(step) for step in self.first_steps), dtype=np.float64, count=len(self.first_steps))
+
+
+# component -> function(grouped lots, machine, time) returning one value per action group (or one for all)
+COMPONENTS = {
+    OT.NO_LOTS: lambda g, m, t: g.sizes,
+    OT.NO_LOTS_PER_BATCH: lambda g, m, t: g.sizes / g.per_step(lambda s: s.batch_max),
+    OT.STEPS_LEFT.MEAN: lambda g, m, t: g.mean('steps_left'),
+    OT.STEPS_LEFT.MEDIAN: lambda g, m, t: g.median('steps_left'),
+    OT.STEPS_LEFT.MAX: lambda g, m, t: g.max('steps_left'),
+    OT.STEPS_LEFT.MIN: lambda g, m, t: g.min('steps_left'),
+    OT.FREE_SINCE.MEAN: lambda g, m, t: g.mean('free_since'),
+    OT.FREE_SINCE.MEDIAN: lambda g, m, t: g.median('free_since'),
+    OT.FREE_SINCE.MAX: lambda g, m, t: g.max('free_since'),
+    OT.FREE_SINCE.MIN: lambda g, m, t: g.min('free_since'),
+    OT.PROCESSING_TIME.AVERAGE: lambda g, m, t: g.per_step(lambda s: s.processing_time.avg()),
+    OT.BATCH.MIN: lambda g, m, t: g.per_step(lambda s: s.batch_min),
+    OT.BATCH.MAX: lambda g, m, t: g.per_step(lambda s: s.batch_max),
+    OT.BATCH.FULLNESS: lambda g, m, t: np.minimum(1, g.sizes / g.per_step(lambda s: s.batch_max)),
+    OT.PRIORITY.MEAN: lambda g, m, t: g.mean('priority'),
+    OT.PRIORITY.MEDIAN: lambda g, m, t: g.median('priority'),
+    OT.PRIORITY.MAX: lambda g, m, t: g.max('priority'),
+    OT.PRIORITY.MIN: lambda g, m, t: g.min('priority'),
+    # CR.MEAN and CR.MEDIAN share an id, the median wins as in the dict based state
+    OT.CR.MEAN: lambda g, m, t: g.mean('cr'),
+    OT.CR.MEDIAN: lambda g, m, t: g.median('cr'),
+    OT.CR.MAX: lambda g, m, t: g.max('cr'),
+    OT.CR.MIN: lambda g, m, t: g.min('cr'),
+    OT.SETUP.NEEDED: lambda g, m, t: g.per_step(
+        lambda s: 0 if s.setup_needed == '' or s.setup_needed == m.current_setup else 1),
+    OT.SETUP.MIN_RUNS_LEFT: lambda g, m, t: 0 if m.min_runs_left is None else m.min_runs_left,
+    OT.SETUP.MIN_RUNS_OK: lambda g, m, t: g.per_step(
+        lambda s: 1 if s.setup_needed == '' or s.setup_needed == m.min_runs_setup else 0),
+    OT.SETUP.LAST_SETUP_TIME: lambda g, m, t: m.last_setup_time,
+    MACHINE.MAINTENANCE.NEXT: lambda g, m, t: 0,
+    MACHINE.IDLE_RATIO: lambda g, m, t: 1 - (m.utilized_time / t) if m.utilized_time > 0 else 1,
+    MACHINE.SETUP_PROCESSING_RATIO: lambda g, m, t: (m.setuped_time / m.utilized_time) if m.utilized_time > 0 else 1,
+    MACHINE.MACHINE_CLASS: lambda g, m, t: 0,
+}
+
+
+class ObservationBuilder:
+    # fills one preallocated float32 observation: 4 machine features followed by
+    # len(state_components) features for each of the num_actions action slots
+
+    def __init__(self, num_actions, state_components):
+        self.num_actions = num_actions
+        self.state_components = tuple(state_components)
+        self.needed = set(self.state_components)
+        self.obs = np.zeros(4 + num_actions * len(self.state_components), dtype=np.float32)
+        self.slots = self.obs[4:].reshape(num_actions, len(self.state_components))
+
+    def build(self, m, t, actions):
+        obs = self.obs
+        obs[0] = m.pms[0].timestamp - t if len(m.pms) > 0 else 999999  # next maintenance
+        obs[1] = m.utilized_time / m.setuped_time if m.setuped_time > 0 else 0  # ratio of setup / processing time
+        obs[2] = (m.setuped_time + m.utilized_time) / t if t > 0 else 0  # ratio of non idle time
+        obs[3] = m.machine_class  # type of machine
+
+        self.slots[:] = EMPTY_ACTION
+        rows = [i for i, action in enumerate(actions) if action is not None]
+        if len(rows) > 0:
+            grouped = GroupedLots([actions[i] for i in rows], t, self.needed)
+            for j, component in enumerate(self.state_components):
+                self.slots[rows, j] = COMPONENTS[component](grouped, m, t)
+        return obs
@@ -0,0 +1,140 @@
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+from simulation.gym.environment import DynamicSCFabSimulationEnvironment
+from simulation.read import read_all
+
+# episodes of one worker use consecutive seeds, workers start this far apart
+SEED_STRIDE = 100000
+
+
+def make_env_fn(rank, seed, **env_kwargs):
+    def make_env():
+        return DynamicSCFabSimulationEnvironment(**env_kwargs, seed=seed + rank * SEED_STRIDE)
+
+    return make_env
+
+
+def shared_memory_worker(remote, parent_remote, env_fn_wrapper, rank):
+    # like stable_baselines3's subprocess worker, but observations are written to a shared buffer
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    # the parent allocates the buffer once it knows the observation shape of the environments
+    remote.send((env.observation_space, env.action_space))
+    name, n_envs = remote.recv()
+    shm = shared_memory.SharedMemory(name=name)
+    obs_buf = np.ndarray((n_envs,) + env.observation_space.shape, dtype=np.float32, buffer=shm.buf)
+    try:
+        worker_loop(remote, env, obs_buf, rank)
+    finally:
+        del obs_buf
+        shm.close()
+
+
+def worker_loop(remote, env, obs_buf, rank):
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                observation, reward, done, info = env.step(data)
+                if done:
+                    info['terminal_observation'] = np.array(observation, dtype=np.float32)
+                    observation = env.reset()
+                obs_buf[rank] = observation
+                remote.send((reward, done, info))
+            elif cmd == 'reset':
+                obs_buf[rank] = env.reset()
+                remote.send(None)
+            elif cmd == 'seed':
+                remote.send(env.seed(data))
+            elif cmd == 'render':
+                remote.send(env.render(data))
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+            elif cmd == 'get_spaces':
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == 'env_method':
+                method = getattr(env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == 'get_attr':
+                remote.send(getattr(env, data))
+            elif cmd == 'set_attr':
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == 'is_wrapped':
+                remote.send(False)
+            else:
+                raise NotImplementedError(f'`{cmd}` is not implemented in the worker')
+        except EOFError:
+            break
+
+
+class SharedMemoryVecEnv(SubprocVecEnv):
+    # SubprocVecEnv whose workers write observations into one shared float32 array,
+    # only rewards, dones and infos go through the pipes
+
+    def __init__(self, env_fns, start_method=None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+        if start_method is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        ctx = multiprocessing.get_context(start_method)
+        # the workers share the resource tracker of this process, so only close() unlinks the observation buffer
+        resource_tracker.ensure_running()
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for rank, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), rank)
+            process = ctx.Process(target=shared_memory_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        spaces = [remote.recv() for remote in self.remotes]
+        observation_space, action_space = spaces[0]
+        assert all(o == observation_space for o, _ in spaces), 'workers have different observation spaces'
+        self.obs_shape = tuple(observation_space.shape)
+        self.shm = shared_memory.SharedMemory(create=True, size=n_envs * int(np.prod(self.obs_shape)) * 4)
+        self.obs_buf = np.ndarray((n_envs,) + self.obs_shape, dtype=np.float32, buffer=self.shm.buf)
+        for remote in self.remotes:
+            remote.send((self.shm.name, n_envs))
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rews, dones, infos = zip(*results)
+        return self.obs_buf.copy(), np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        for remote in self.remotes:
+            remote.recv()
+        return self.obs_buf.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self.obs_buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+def make_vec_env(num_envs, seed, shared_memory=True, **env_kwargs):
+    # K independent fab simulations with seeds far apart, each worker loads the dataset from the read_all cache
+    read_all('datasets/' + env_kwargs['dataset'])
+    env_fns = [make_env_fn(rank, seed, **env_kwargs) for rank in range(num_envs)]
+    if num_envs == 1:
+        return DummyVecEnv(env_fns)
+    if not shared_memory:
+        return SubprocVecEnv(env_fns)
+    return SharedMemoryVecEnv(env_fns)
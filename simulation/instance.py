@@ -1,47 +1,116 @@
+import io
+import pickle
+import sys
 from collections import defaultdict
 from typing import Dict, List, Set, Tuple
 
-from simulation.classes import Machine, Route, Lot
+from simulation.checkpoint import RECURSION_LIMIT
+from simulation.classes import Machine, Route, Lot, PROCESSING, TRANSPORT, CASCADING
 from simulation.dispatching.dm_lot_for_machine import LotForMachineDispatchManager
 from simulation.dispatching.dm_machine_for_lot import MachineForLotDispatchManager
 from simulation.event_queue import EventQueue
 from simulation.events import MachineDoneEvent, LotDoneEvent, BreakdownEvent, ReleaseEvent
-from simulation.plugins.interface import IPlugin
+from simulation.plugins.interface import IPlugin, PluginHooks
+from simulation.release_queue import LotReleaseQueue, ListReleases, OrderReleases
+from simulation.randomizer import Randomizer, RandomSource
+from simulation.setup_matrix import SetupMatrix
+
+
+class SharedPickler(pickle.Pickler):
+    # pickles the objects of `shared` as their position in it
+
+    def __init__(self, file, shared):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.shared = {id(o): i for i, o in enumerate(shared)}
+
+    def persistent_id(self, obj):
+        return self.shared.get(id(obj))
+
+
+class SharedUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+
+def dumps_shared(obj, shared):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        f = io.BytesIO()
+        SharedPickler(f, shared).dump(obj)
+        return f.getvalue()
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def loads_shared(data, shared):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        return SharedUnpickler(io.BytesIO(data), shared).load()
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+class InstanceSnapshot:
+
+    def __init__(self, state, random_state):
+        self.state = state
+        self.random_state = random_state
 
 
 class Instance:
 
     def __init__(self, machines: List[Machine], routes: Dict[str, Route], lots: List[Lot],
                  setups: Dict[Tuple, int], setup_min_run: Dict[str, int], breakdowns: List[BreakdownEvent],
-                 lot_for_machine, plugins):
+                 lot_for_machine, plugins, keep_done_lots=True, randomizer=None):
+        # all randomness of the simulation, the process wide Randomizer unless the instance is given its own
+        self.randomizer: RandomSource = randomizer if randomizer is not None else Randomizer()
         self.plugins: List[IPlugin] = plugins
-        self.lot_waiting_at_machine = defaultdict(lambda: (0, 0))
+        self.hooks = PluginHooks(plugins)
+        # without keep_done_lots finished lots are only seen by the plugins (e.g. StatisticsPlugin) and then dropped
+        self.keep_done_lots = keep_done_lots
+        # family -> (lots dispatched, summed waiting time), no lambdas in the state so that it can be pickled
+        self.lot_waiting_at_machine = {}
 
         self.free_machines: List[bool] = []
         self.usable_machines: Set[Machine] = set()
         self.usable_lots: List[Lot] = list()
 
         self.machines: List[Machine] = [m for m in machines]
-        self.family_machines = defaultdict(lambda: [])
+        self.family_machines = defaultdict(list)
         for m in self.machines:
             self.family_machines[m.family].append(m)
         self.routes: Dict[str, Route] = routes
         self.setups: Dict[Tuple, int] = setups
         self.setup_min_run: Dict[str, int] = setup_min_run
+        # setups compiled to an integer id matrix, machines and steps refer to it by setup_id
+        steps = [s for route in routes.values() for s in route.steps]
+        self.setup_matrix = SetupMatrix(setups, [s.setup_needed for s in steps])
+        for s in steps:
+            s.setup_id = self.setup_matrix.ids[s.setup_needed]
 
         self.dm = LotForMachineDispatchManager() if lot_for_machine else MachineForLotDispatchManager()
         self.dm.init(self)
 
-        self.dispatchable_lots: List[Lot] = lots
-        self.dispatchable_lots.sort(key=lambda k: k.release_at)
+        # lots not released yet, in release order
+        if not isinstance(lots, LotReleaseQueue):
+            lots = LotReleaseQueue([ListReleases(lots)])
+        self.dispatchable_lots: LotReleaseQueue = lots
         self.active_lots: List[Lot] = []
         self.done_lots: List[Lot] = []
+        self.done_lot_count = 0
 
         self.events = EventQueue()
 
         self.current_time = 0
 
-        for plugin in self.plugins:
+        for plugin in self.hooks.on_sim_init:
             plugin.on_sim_init(self)
 
         self.next_step()
@@ -59,11 +128,11 @@ class Instance:
 
     def next_step(self):
         process_until = []
-        if len(self.events.arr) > 0:
+        if not self.events.empty:
             process_until.append(max(0, self.events.first.timestamp))
-        process_until.append(max(0, self.dispatchable_lots[0].release_at))
+        process_until.append(max(0, self.dispatchable_lots.first.release_at))
         process_until = min(process_until)
-        while len(self.events.arr) > 0 and self.events.first.timestamp <= process_until:
+        while not self.events.empty and self.events.first.timestamp <= process_until:
             ev = self.events.pop_first()
             self.current_time = max(0, ev.timestamp, self.current_time)
             # print(f'Time stamp {self.current_time}')
@@ -76,7 +145,7 @@ class Instance:
             machine.events.clear()
             self.dm.free_up_machine(self, machine)
 
-            for plugin in self.plugins:
+            for plugin in self.hooks.on_machine_free:
                 plugin.on_machine_free(self, machine)
 
     def free_up_lots(self, lots: List[Lot]):
@@ -84,41 +153,35 @@ class Instance:
         for lot in lots:
             lot.free_since = self.current_time
             step_found = False
-            while len(lot.remaining_steps) > 0:
-                old_step = None
-                if lot.actual_step is not None:
-                    lot.processed_steps.append(lot.actual_step)
-                    old_step = lot.actual_step
-                if lot.actual_step is not None and lot.actual_step.has_to_rework(lot.idx):
-                    rw_step = lot.actual_step.rework_step
-                    removed = lot.processed_steps[rw_step - 1:]
-                    lot.processed_steps = lot.processed_steps[:rw_step - 1]
-                    lot.remaining_steps = removed + lot.remaining_steps
-                lot.actual_step, lot.remaining_steps = lot.remaining_steps[0], lot.remaining_steps[1:]
-                if lot.actual_step.has_to_perform():
+            while lot.steps_left > 0:
+                old_step = lot.actual_step
+                lot.advance(self.randomizer)
+                if lot.actual_step.has_to_perform(lot, self.randomizer):
                     # print(f'Lot {lot.idx} step {len(lot.processed_steps)} / {len(lot.remaining_steps)}')
                     self.dm.free_up_lots(self, lot)
                     step_found = True
-                    for plugin in self.plugins:
+                    for plugin in self.hooks.on_step_done:
                         plugin.on_step_done(self, lot, old_step)
                     break
             if not step_found:
-                assert len(lot.remaining_steps) == 0
+                assert lot.steps_left == 0
                 lot.actual_step = None
                 lot.done_at = self.current_time
                 # print(f'Lot {lot.idx} is done {len(self.active_lots)} {len(self.done_lots)} {self.current_time_days}')
                 self.active_lots.remove(lot)
-                self.done_lots.append(lot)
-                for plugin in self.plugins:
+                self.done_lot_count += 1
+                if self.keep_done_lots:
+                    self.done_lots.append(lot)
+                for plugin in self.hooks.on_lot_done:
                     plugin.on_lot_done(self, lot)
 
-            for plugin in self.plugins:
+            for plugin in self.hooks.on_lot_free:
                 plugin.on_lot_free(self, lot)
 
     def dispatch(self, machine: Machine, lots: List[Lot]):
         # remove machine and lot from active sets
         self.reserve_machine_lot(lots, machine)
-        lwam = self.lot_waiting_at_machine[machine.family]
+        lwam = self.lot_waiting_at_machine.get(machine.family, (0, 0))
         self.lot_waiting_at_machine[machine.family] = (lwam[0] + len(lots),
                                                        lwam[1] + sum([self.current_time - l.free_since for l in lots]))
         for lot in lots:
@@ -130,17 +193,17 @@ class Instance:
                 lot.cqt_deadline = lot.actual_step.cqt_time
             if lot.actual_step.order == lot.cqt_waiting:
                 if lot.cqt_deadline < self.current_time:
-                    for plugin in self.plugins:
+                    for plugin in self.hooks.on_cqt_violated:
                         plugin.on_cqt_violated(self, machine, lot)
                 lot.cqt_waiting = None
                 lot.cqt_deadline = None
         # compute times for lot and machine
-        lot_time, machine_time, setup_time = self.get_times(self.setups, lots, machine)
+        lot_time, machine_time, setup_time = self.get_times(self.setup_matrix, lots, machine)
         # compute per-piece preventive maintenance requirement
         for i in range(len(machine.pieces_until_maintenance)):
             machine.pieces_until_maintenance[i] -= sum([l.pieces for l in lots])
             if machine.pieces_until_maintenance[i] <= 0:
-                s = machine.maintenance_time[i].sample()
+                s = machine.sample_maintenance_time(i, self.randomizer)
                 machine_time += s
                 machine.pieces_until_maintenance[i] = machine.piece_per_maintenance[i]
                 machine.pmed_time += s
@@ -163,21 +226,21 @@ class Instance:
         self.add_event(ev2)
         machine.events += [ev1, ev2]
 
-        for plugin in self.plugins:
+        for plugin in self.hooks.on_dispatch:
             plugin.on_dispatch(self, machine, lots, machine_done, lot_done)
         return machine_done, lot_done
 
     def get_times(self, setups, lots, machine):
         """디스패칭 시 소요 시간 계산 (lot_time, machine_time, setup_time)"""
         # 로트 처리 시간 = 공정 시간 + 로드/언로드 시간
-        proc_t_samp = lots[0].actual_step.processing_time.sample()
+        proc_t_samp = lots[0].sample(lots[0].actual_step.processing_time, PROCESSING, self.randomizer)
         lot_time = proc_t_samp + machine.load_time + machine.unload_time
         for lot in lots:
             lot.processing_time += lot_time
 
         # 다음 스텝이 있으면 운송 시간 추가
-        if len(lots[0].remaining_steps) > 0:
-            tt = lots[0].remaining_steps[0].transport_time.sample()
+        if lots[0].steps_left > 0:
+            tt = lots[0].sample(lots[0].next_step.transport_time, TRANSPORT, self.randomizer)
             lot_time += tt
             for lot in lots:
                 lot.transport_time += tt
@@ -189,23 +252,13 @@ class Instance:
             cascade_t_samp = proc_t_samp
         else:
             # cascading 있음: cascading_time 후 머신 유휴 (로트는 아직 처리 중)
-            cascade_t_samp = lots[0].actual_step.cascading_time.sample()
+            cascade_t_samp = lots[0].sample(lots[0].actual_step.cascading_time, CASCADING, self.randomizer)
         # 머신이 다시 사용 가능해지는 시간
         machine_time = cascade_t_samp + (machine.load_time + machine.unload_time if not machine.cascading else 0)
 
         # ========== Setup 시간 계산 ==========
         new_setup = lots[0].actual_step.setup_needed
-        if new_setup != '' and machine.current_setup != new_setup:
-            if lots[0].actual_step.setup_time is not None:
-                setup_time = lots[0].actual_step.setup_time
-            elif (machine.current_setup, new_setup) in setups:
-                setup_time = setups[(machine.current_setup, new_setup)]
-            elif ('', new_setup) in setups:
-                setup_time = setups[('', new_setup)]
-            else:
-                setup_time = 0
-        else:
-            setup_time = 0
+        setup_time = setups.setup_time(machine.setup_id, lots[0].actual_step)
 
         # ========== min_runs 제약 설정 ==========
         if new_setup in self.setup_min_run:
@@ -220,6 +273,7 @@ class Instance:
         machine.setuped_time += setup_time
         machine.last_setup = machine.current_setup
         machine.current_setup = new_setup
+        machine.setup_id = lots[0].actual_step.setup_id
         return lot_time, machine_time, setup_time
 
     def reserve_machine_lot(self, lots, machine):
@@ -233,21 +287,51 @@ class Instance:
         return self.dm.next_decision_point(self)
 
     def handle_breakdown(self, machine, delay):
-        ta = []
         for ev in machine.events:
-            if ev in self.events.arr:
-                ta.append(ev)
-                self.events.remove(ev)
-        for ev in ta:
-            ev.timestamp += delay
-            self.add_event(ev)
+            if ev in self.events:
+                self.events.reschedule(ev, ev.timestamp + delay)
+
+    def shared_objects(self):
+        # the structures that never change during a run (routes with their steps, setups, order data), snapshots and
+        # forks refer to them instead of copying them
+        shared = [self.routes, self.setups, self.setup_min_run, self.setup_matrix]
+        for route in self.routes.values():
+            shared += [route, route.steps, route.time_left, *route.steps]
+        for stream in self.dispatchable_lots.streams:
+            if isinstance(stream, OrderReleases):
+                shared.append(stream.order)
+        return shared
+
+    def snapshot(self):
+        # full copy of the simulation state (lots, machines, events, dispatch manager, plugins) and of the RNG,
+        # pickled: much faster than a deepcopy and the bytes are never changed
+        state = {k: v for k, v in self.__dict__.items() if k != 'randomizer'}
+        return InstanceSnapshot(dumps_shared(state, self.shared_objects()), self.randomizer.getstate())
+
+    def restore(self, snapshot: InstanceSnapshot):
+        # the snapshot stays untouched, so it can be restored any number of times
+        self.__dict__.update(loads_shared(snapshot.state, self.shared_objects()))
+        self.randomizer.setstate(snapshot.random_state)
+
+    def fork(self, randomizer: RandomSource = None):
+        # independent copy of the simulation that draws from randomizer, by default from a new source continuing
+        # where this instance's RNG is now
+        if randomizer is None:
+            randomizer = RandomSource()
+            randomizer.setstate(self.randomizer.getstate())
+        state = {k: v for k, v in self.__dict__.items() if k != 'randomizer'}
+        shared = self.shared_objects()
+        forked = type(self).__new__(type(self))
+        forked.__dict__.update(loads_shared(dumps_shared(state, shared), shared))
+        forked.randomizer = randomizer
+        return forked
 
     @property
     def done(self):
         return len(self.dispatchable_lots) == 0 and len(self.active_lots) == 0
 
     def finalize(self):
-        for plugin in self.plugins:
+        for plugin in self.hooks.on_sim_done:
             plugin.on_sim_done(self)
 
     def print_progress_in_days(self):
@@ -256,5 +340,5 @@ class Instance:
             self.printed_days = int(self.current_time_days)
             if self.printed_days > 0:
                 sys.stderr.write(
-                    f'\rDay {self.printed_days}===Throughput: {round(len(self.done_lots) / self.printed_days)}/day=')
+                    f'\rDay {self.printed_days}===Throughput: {round(self.done_lot_count / self.printed_days)}/day=')
                 sys.stderr.flush()
@@ -16,10 +16,10 @@ def random_color():
 class ChartPlugin(IPlugin):
     def on_sim_init(self, instance):
         self.debug_step_count = 0
-        self.visualization_data_jobs = defaultdict(lambda: [])
-        self.visualization_data_jobs_colors = defaultdict(lambda: [])
-        self.visualization_data_tools = defaultdict(lambda: [])
-        self.visualization_data_tools_colors = defaultdict(lambda: [])
+        self.visualization_data_jobs = defaultdict(list)
+        self.visualization_data_jobs_colors = defaultdict(list)
+        self.visualization_data_tools = defaultdict(list)
+        self.visualization_data_tools_colors = defaultdict(list)
         self.visualization_task_colors = defaultdict(random_color)
         self.visualization_tool_colors = defaultdict(random_color)
 
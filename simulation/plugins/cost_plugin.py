@@ -3,18 +3,35 @@ from simulation.plugins.interface import IPlugin
 
 class CostPlugin(IPlugin):
 
+    def on_sim_init(self, instance):
+        super().on_sim_init(instance)
+        self.lot_cost = 0
+        self.done_lots = 0
+        # released lots that are not done, each costs 200 if the run is reported now
+        self.open_lots = 0
+
+    def on_lots_release(self, instance, lots):
+        self.open_lots += len(lots)
+
+    def on_lot_done(self, instance, lot):
+        super().on_lot_done(instance, lot)
+        self.lot_cost += 25 if lot.deadline_at < lot.done_at else 0
+        self.lot_cost += max(0, lot.done_at - lot.deadline_at) / 3600 / 24
+        self.done_lots += 1
+        self.open_lots -= 1
+
     def on_sim_done(self, instance):
         super().on_sim_done(instance)
-        self.cost = 0
-        for lot in instance.done_lots:
-            self.cost += 25 if lot.deadline_at < lot.done_at else 0
-            self.cost += max(0, lot.done_at - lot.deadline_at) / 3600 / 24
-        self.cost += len(instance.active_lots) * 200
-        self.done_lots = len(instance.done_lots)
+        self.cost = self.current_cost
 
     def get_output_name(self):
         super().get_output_name()
         return 'cost'
 
+    @property
+    def current_cost(self):
+        return self.lot_cost + self.open_lots * 200
+
     def get_output_value(self):
-        return self.cost
+        # the cost so far, so intermediate reports of a run see it too
+        return self.current_cost
@@ -8,6 +8,10 @@ class IPlugin(metaclass=ABCMeta):
     def on_sim_done(self, instance):
         pass
 
+    def on_sim_resume(self, instance):
+        # the instance was loaded from a checkpoint, plugin state is restored with it
+        pass
+
     def on_lots_release(self, instance, lots):
         pass
 
@@ -26,10 +30,10 @@ class IPlugin(metaclass=ABCMeta):
     def on_lot_free(self, instance, lot):
         pass
 
-    def on_breakdown(self, machine, breakdown_event):
+    def on_breakdown(self, instance, breakdown_event):
         pass
 
-    def on_preventive_maintenance(self, machine, preventive_maintenance_event):
+    def on_preventive_maintenance(self, instance, preventive_maintenance_event):
         pass
 
     def get_output_name(self):
@@ -40,3 +44,20 @@ class IPlugin(metaclass=ABCMeta):
 
     def on_cqt_violated(self, instance, machine, lot):
         pass
+
+
+HOOKS = ['on_sim_init', 'on_sim_done', 'on_sim_resume', 'on_lots_release', 'on_lot_done', 'on_step_done',
+         'on_dispatch', 'on_machine_free', 'on_lot_free', 'on_breakdown', 'on_preventive_maintenance', 'on_cqt_violated']
+
+
+class PluginHooks:
+    # per hook, the plugins that override it; the simulation only calls those and skips hooks with empty lists
+
+    def __init__(self, plugins):
+        for hook in HOOKS:
+            setattr(self, hook, [plugin for plugin in plugins if overrides(plugin, hook)])
+
+
+def overrides(plugin, hook):
+    method = getattr(type(plugin), hook, None)
+    return method is not None and method is not getattr(IPlugin, hook)
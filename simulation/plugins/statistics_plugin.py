@@ -0,0 +1,74 @@
+from collections import defaultdict
+from fractions import Fraction
+
+from simulation.classes import Lot
+from simulation.plugins.interface import IPlugin
+
+
+def new_product():
+    return {'act_sum': Fraction(0), 'throughput': 0, 'on_time': 0, 'tardiness': 0, 'waiting_time': 0,
+            'processing_time': 0, 'transport_time': 0, 'waiting_time_batching': 0}
+
+
+def completion(lot: Lot):
+    # one row of the lots table of the result store
+    return (lot.idx, lot.name, lot.release_at, lot.done_at, lot.deadline_at, lot.waiting_time,
+            lot.waiting_time_batching, lot.processing_time, lot.transport_time)
+
+
+class StatisticsPlugin(IPlugin):
+    # per product statistics accumulated as lots finish, nothing is rescanned at the end of the run.
+    # ACT is summed exactly so its mean equals statistics.mean over all cycle times
+
+    def __init__(self, keep_completions=False):
+        self.products = defaultdict(new_product)
+        self.references = {}
+        self.done = 0
+        self.done_late = 0
+        # with keep_completions one completion row per finished lot, also when the lots themselves are dropped
+        self.keep_completions = keep_completions
+        self.completions = []
+
+    @staticmethod
+    def from_lots(lots):
+        plugin = StatisticsPlugin()
+        for lot in lots:
+            plugin.add(lot)
+        return plugin
+
+    def on_sim_init(self, instance):
+        self.__init__(self.keep_completions)
+
+    def on_lot_done(self, instance, lot):
+        self.add(lot)
+
+    def add(self, lot: Lot):
+        p = self.products[lot.name]
+        p['act_sum'] += Fraction(lot.done_at - lot.release_at)
+        p['throughput'] += 1
+        p['tardiness'] += max(0, lot.done_at - lot.deadline_at)
+        p['waiting_time'] += lot.waiting_time
+        p['waiting_time_batching'] += lot.waiting_time_batching
+        p['processing_time'] += lot.processing_time
+        p['transport_time'] += lot.transport_time
+        self.done += 1
+        if self.keep_completions:
+            self.completions.append(completion(lot))
+        if lot.done_at <= lot.deadline_at:
+            p['on_time'] += 1
+        else:
+            self.done_late += 1
+        if lot.name not in self.references:
+            apt = sum([s.processing_time.avg() for s in lot.processed_steps])
+            self.references[lot.name] = (apt, lot.deadline_at - lot.release_at)
+
+    @property
+    def done_in_time(self):
+        return self.done - self.done_late
+
+    def lot_statistics(self):
+        lots = {}
+        for name, p in self.products.items():
+            lots[name] = {'ACT': float(p['act_sum'] / p['throughput']) / 3600 / 24,
+                          **{k: v for k, v in p.items() if k != 'act_sum'}}
+        return lots
@@ -0,0 +1,128 @@
+import io
+import json
+import struct
+
+from simulation.plugins.interface import IPlugin
+
+# trace file: header (magic, version, record size) followed by fixed width little endian records, family and product
+# names are written to a JSON file next to it, see simulation.trace_reader
+MAGIC = b'SCFTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+# time, end, aux, machine idx, lot idx, step order, name id (family or product), kind, lot count
+RECORD = struct.Struct('<dddiiihBB')
+# records buffered before they are appended to the file
+BLOCK_RECORDS = 65536
+
+# kinds and the meaning of end / aux
+DISPATCH = 1  # one record per lot, end: machine done, aux: lot done, name: family, count: batch size
+LOT_FREE = 2  # the lot starts waiting for its next step, name: family of the step
+LOT_DONE = 3  # end: deadline, aux: release time, name: product
+MACHINE_FREE = 4  # name: family
+BREAKDOWN = 5  # end: end of the downtime, name: family
+PREVENTIVE_MAINTENANCE = 6  # end: end of the downtime, name: family
+RELEASE = 7  # end: deadline, name: product
+KINDS = {DISPATCH: 'dispatch', LOT_FREE: 'lot_free', LOT_DONE: 'lot_done', MACHINE_FREE: 'machine_free',
+         BREAKDOWN: 'breakdown', PREVENTIVE_MAINTENANCE: 'preventive_maintenance', RELEASE: 'release'}
+
+
+def names_path(path):
+    return path + '.names.json'
+
+
+class TracePlugin(IPlugin):
+    # appends the simulation events to a binary trace file, one struct.pack_into per event into a block buffer
+
+    def __init__(self, path='trace.bin', block_records=BLOCK_RECORDS):
+        self.path = path
+        self.block_records = block_records
+
+    def on_sim_init(self, instance):
+        self.buffer = bytearray(RECORD.size * self.block_records)
+        self.buffered = 0
+        self.written = 0
+        self.families = {}
+        self.products = {}
+        with io.open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+    def __getstate__(self):
+        # snapshots and checkpoints keep only the filled part of the buffer
+        state = dict(self.__dict__)
+        if 'buffer' in state:
+            state['buffer'] = bytes(self.buffer[:self.buffered * RECORD.size])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'buffer' in state:
+            self.buffer = bytearray(RECORD.size * self.block_records)
+            self.buffer[:len(state['buffer'])] = state['buffer']
+
+    def on_sim_resume(self, instance):
+        # drop the records written after the checkpoint, the resumed run writes them again
+        with io.open(self.path, 'r+b') as f:
+            f.truncate(HEADER.size + self.written * RECORD.size)
+
+    def on_sim_done(self, instance):
+        self.flush()
+
+    def record(self, time, end, aux, machine, lot, step, name, kind, count):
+        RECORD.pack_into(self.buffer, self.buffered * RECORD.size, time, end, aux, machine, lot, step, name, kind,
+                         count)
+        self.buffered += 1
+        if self.buffered == self.block_records:
+            self.flush()
+
+    def flush(self):
+        with io.open(self.path, 'ab') as f:
+            f.write(memoryview(self.buffer)[:self.buffered * RECORD.size])
+        self.written += self.buffered
+        self.buffered = 0
+        with io.open(names_path(self.path), 'w') as f:
+            json.dump({'families': list(self.families.keys()), 'products': list(self.products.keys())}, f)
+
+    def family_id(self, family):
+        if family not in self.families:
+            self.families[family] = len(self.families)
+        return self.families[family]
+
+    def product_id(self, product):
+        if product not in self.products:
+            self.products[product] = len(self.products)
+        return self.products[product]
+
+    def on_dispatch(self, instance, machine, lots, machine_end_time, lot_end_time):
+        family = self.family_id(machine.family)
+        count = min(255, len(lots))
+        for lot in lots:
+            self.record(instance.current_time, machine_end_time, lot_end_time, machine.idx, lot.idx,
+                        lot.actual_step.order, family, DISPATCH, count)
+
+    def on_lot_free(self, instance, lot):
+        if lot.actual_step is not None:
+            self.record(instance.current_time, 0, 0, -1, lot.idx, lot.actual_step.order,
+                        self.family_id(lot.actual_step.family), LOT_FREE, 1)
+
+    def on_lot_done(self, instance, lot):
+        self.record(lot.done_at, lot.deadline_at, lot.release_at, -1, lot.idx, -1, self.product_id(lot.name),
+                    LOT_DONE, 1)
+
+    def on_machine_free(self, instance, machine):
+        self.record(instance.current_time, 0, 0, machine.idx, -1, -1, self.family_id(machine.family), MACHINE_FREE, 0)
+
+    def on_breakdown(self, instance, breakdown_event):
+        self.record_downtime(instance, breakdown_event, BREAKDOWN)
+
+    def on_preventive_maintenance(self, instance, preventive_maintenance_event):
+        self.record_downtime(instance, preventive_maintenance_event, PREVENTIVE_MAINTENANCE)
+
+    def record_downtime(self, instance, event, kind):
+        machine = event.machine
+        self.record(instance.current_time, instance.current_time + event.downtime, 0, machine.idx, -1, -1,
+                    self.family_id(machine.family), kind, 0)
+
+    def on_lots_release(self, instance, lots):
+        for lot in lots:
+            self.record(instance.current_time, lot.deadline_at, 0, -1, lot.idx, -1, self.product_id(lot.name),
+                        RELEASE, 1)
@@ -18,6 +18,11 @@ def meanor0(li):
         return 0
 
 
+def counters():
+    # module level factory instead of a lambda, so that the plugin state can be pickled into a checkpoint
+    return defaultdict(int)
+
+
 class WandBPlugin(IPlugin):
     def on_sim_init(self, instance):
         wandb.init()
@@ -31,33 +36,29 @@ class WandBPlugin(IPlugin):
         self.wandb_batch_util = []
         self.wandb_step_count = 0
 
-        self.wandb_last_setup = defaultdict(lambda: None)
-        self.wandb_same_setup_count = defaultdict(lambda: 0)
+        self.wandb_last_setup = {}
+        self.wandb_same_setup_count = defaultdict(int)
         self.wandb_avg_steps_after_setup = [0]
         self.wandb_avg_steps_after_setup_1 = [0]
         self.wandb_avg_steps_after_setup_2 = [0]
         self.wandb_resetups = 0
         self.wandb_setup_machines = set()
         self.wandb_cqt_violations  = 0
+        self.wandb_done_in_time = 0
+        self.wandb_done_late = 0
+        self.wandb_lot_groups = defaultdict(counters)
+
+    def on_sim_resume(self, instance):
+        wandb.init()
 
     def on_sim_done(self, instance):
         self.step(instance, force=True)
         columns = ['lot name', 'in progress', 'completed', 'completed on time', 'on time percent', 'average cycle time',
                    'theoretical processing time']
 
-        groups = defaultdict(lambda: defaultdict(lambda: 0))
+        groups = self.wandb_lot_groups
         for lot in instance.active_lots:
             groups[lot.name]['in progress'] += 1
-        for lot in instance.done_lots:
-            groups[lot.name]['completed'] += 1
-            if lot.done_at <= lot.deadline_at:
-                groups[lot.name]['completed on time'] += 1
-            groups[lot.name]['on time percent'] = round(
-                groups[lot.name]['completed on time'] / groups[lot.name]['completed'] * 100, 2)
-            groups[lot.name]['act_sum'] += lot.done_at - lot.release_at
-            groups[lot.name]['average cycle time'] = round(
-                groups[lot.name]['act_sum'] / groups[lot.name]['completed'] / 3600 / 24, 2)
-            groups[lot.name]['theoretical processing time'] = round(lot.full_time / 3600 / 24, 2)
 
         rows = []
         for k, v in groups.items():
@@ -77,6 +78,20 @@ class WandBPlugin(IPlugin):
         })
         wandb.finish()
 
+    def on_lot_done(self, instance, lot):
+        if lot.done_at <= lot.deadline_at:
+            self.wandb_done_in_time += 1
+        else:
+            self.wandb_done_late += 1
+        group = self.wandb_lot_groups[lot.name]
+        group['completed'] += 1
+        if lot.done_at <= lot.deadline_at:
+            group['completed on time'] += 1
+        group['on time percent'] = round(group['completed on time'] / group['completed'] * 100, 2)
+        group['act_sum'] += lot.done_at - lot.release_at
+        group['average cycle time'] = round(group['act_sum'] / group['completed'] / 3600 / 24, 2)
+        group['theoretical processing time'] = round(lot.full_time / 3600 / 24, 2)
+
     def on_dispatch(self, instance, machine, lots, machine_end_time, lot_end_time):
         machine: Machine
         lots: List[Lot]
@@ -105,11 +120,11 @@ class WandBPlugin(IPlugin):
 
     def step(self, instance, force=False):
         if self.wandb_step_count % WANDB_LOG_INTERVAL == 0 or force:
-            now_done = len(instance.done_lots) - self.wandb_lots_already_done
+            now_done = instance.done_lot_count - self.wandb_lots_already_done
             elapsed_time = instance.current_time_days - self.wandb_time_done
             wandb.log({
                 'lots/wip': len(instance.active_lots),
-                'lots/done': len(instance.done_lots),
+                'lots/done': instance.done_lot_count,
                 'machines/free': meanor0(self.wandb_machine_free_count),
                 'machines/free_with_lots_waiting': meanor0(self.wandb_machine_usable_count),
                 'lots/steps_performed': self.wandb_steps_performed,
@@ -126,11 +141,11 @@ class WandBPlugin(IPlugin):
                 'machines/avg_run_per_setup': statistics.mean(self.wandb_avg_steps_after_setup),
                 'machines/avg_run_per_setup_for_enforced': statistics.mean(self.wandb_avg_steps_after_setup_2),
                 'machines/avg_run_per_setup_NOT_enforced': statistics.mean(self.wandb_avg_steps_after_setup_1),
-                'lots/done_in_time': len([l for l in instance.done_lots if l.done_at <= l.deadline_at]),
-                'lots/done_late': len([l for l in instance.done_lots if l.done_at > l.deadline_at]),
+                'lots/done_in_time': self.wandb_done_in_time,
+                'lots/done_late': self.wandb_done_late,
                 'lots/cqt_violations': self.wandb_cqt_violations,
             })
-            self.wandb_lots_already_done = len(instance.done_lots)
+            self.wandb_lots_already_done = instance.done_lot_count
             self.wandb_machine_free_count.clear()
             self.wandb_machine_usable_count.clear()
             self.wandb_batch_util.clear()
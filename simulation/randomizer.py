@@ -1,4 +1,6 @@
+import hashlib
 import os
+import struct
 from random import Random
 
 
@@ -11,7 +13,33 @@ class Singleton(type):
         return cls._instances[cls]
 
 
-class Randomizer(metaclass=Singleton):
+class RandomSource:
+    # all randomness of one simulation, an Instance draws only from its own source so that several simulations can
+    # run side by side in one process
+    def __init__(self, seed=None):
+        self.random = Random(seed)
+        # with common random numbers, fab randomness (processing, transport, sampling, rework, downtimes) comes from
+        # streams keyed by lot/step and machine instead of self.random, so it is the same for every dispatcher
+        self.crn_seed = None
+
+    def seed(self, seed, common_random_numbers=False):
+        self.random.seed(seed)
+        self.crn_seed = seed if common_random_numbers else None
+
+    def getstate(self):
+        return self.random.getstate(), self.crn_seed
+
+    def setstate(self, state):
+        random_state, self.crn_seed = state
+        self.random.setstate(random_state)
+
+    def uniforms(self, n, *key):
+        # n uniform [0, 1) values of the stream keyed by (seed, *key), independent of any other draw
+        digest = hashlib.blake2b(repr((self.crn_seed,) + key).encode(), digest_size=8 * n).digest()
+        return tuple([(v >> 11) * (1.0 / 9007199254740992) for v in struct.unpack(f'<{n}Q', digest)])
+
+
+class Randomizer(RandomSource, metaclass=Singleton):
+    # the process wide RandomSource, used by the simulations that are not given their own
     def __init__(self):
-        random_seed = int(os.environ['SEED']) if 'SEED' in os.environ else None
-        self.random = Random(random_seed)
+        super().__init__(int(os.environ['SEED']) if 'SEED' in os.environ else None)
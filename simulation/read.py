@@ -1,11 +1,21 @@
+import hashlib
 import io
 import os
+import pickle
 from collections import defaultdict
 from os import environ
 
 from simulation.dataset_preprocess import RemoveBreakdowns, RemoveWIP, RemoveRework, RemoveSampling, \
     RemovePreventiveMaintenance
 
+# bump when the parsed representation changes, old cache files are ignored then
+CACHE_VERSION = 1
+CACHE_DIR = '.compiled'
+
+
+def none():
+    return None
+
 
 def try_to_num(inp: str):
     try:
@@ -24,7 +34,7 @@ def read_txt(path):
     dicts = []
     for line in lines:
         cols = line.split('\t')
-        d = defaultdict(lambda: None)
+        d = defaultdict(none)
         all_none = True
         for header, col in zip(headers, cols):
             if header.upper() != 'IGNORE':
@@ -37,11 +47,41 @@ def read_txt(path):
     return dicts
 
 
-def read_all(d, preprocessors=None):
-    files = defaultdict(lambda: [])
-    for file in os.listdir(d):
+def cache_key(d, preprocessors):
+    h = hashlib.sha1(f'v{CACHE_VERSION}'.encode())
+    for file in sorted(os.listdir(d)):
         if '.txt' in file:
-            files[file] = read_txt(os.path.join(d, file))
+            h.update(file.encode())
+            with io.open(os.path.join(d, file), 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+    for p in preprocessors:
+        h.update(type(p).__name__.encode())
+    return h.hexdigest()
+
+
+def read_cached(d, preprocessors):
+    # parsed and preprocessed files are pickled next to the dataset, keyed by file contents and preprocessors
+    cache_dir = os.path.join(d, CACHE_DIR)
+    cache_file = os.path.join(cache_dir, cache_key(d, preprocessors) + '.pickle')
+    if os.path.exists(cache_file):
+        try:
+            with io.open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            pass
+    files = read_all(d, preprocessors, cache=False)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with io.open(tmp_file, 'wb') as f:
+            pickle.dump(files, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+    return files
+
+
+def read_all(d, preprocessors=None, cache=None):
     if preprocessors is None:
         preprocessors = []
         if 'NOWIP' in environ:
@@ -54,6 +94,14 @@ def read_all(d, preprocessors=None):
             preprocessors.append(RemoveRework())
         if 'NOSAMPLING' in environ:
             preprocessors.append(RemoveSampling())
+    if cache is None:
+        cache = 'NOCACHE' not in environ
+    if cache:
+        return read_cached(d, preprocessors)
+    files = defaultdict(list)
+    for file in os.listdir(d):
+        if '.txt' in file:
+            files[file] = read_txt(os.path.join(d, file))
     if preprocessors is not None:
         for p in preprocessors:
             files = p.preprocess(files)
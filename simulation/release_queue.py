@@ -0,0 +1,67 @@
+import heapq
+
+from simulation.classes import Lot
+
+
+class OrderReleases:
+    # the repetitions of one order, lot i is created only when it is next to be released
+
+    def __init__(self, first_idx, count, route, priority, release_interval, relative_deadline, order):
+        self.first_idx = first_idx
+        self.count = count
+        self.route = route
+        self.priority = priority
+        self.release_interval = release_interval
+        self.relative_deadline = relative_deadline
+        self.order = order
+
+    def __len__(self):
+        return self.count
+
+    def lot(self, i):
+        first_release = 0
+        rel_time = first_release + i * self.release_interval
+        return Lot(self.first_idx + i, self.route, self.priority, rel_time, self.relative_deadline, self.order)
+
+
+class ListReleases:
+    # lots that already exist, sorted by release time
+
+    def __init__(self, lots):
+        self.lots = sorted(lots, key=lambda k: k.release_at)
+
+    def __len__(self):
+        return len(self.lots)
+
+    def lot(self, i):
+        return self.lots[i]
+
+
+class LotReleaseQueue:
+    # merges the release streams by release time, only the next lot of each stream exists before its release.
+    # equal release times keep the stream order, same as a stable sort of all lots
+    def __init__(self, streams):
+        self.streams = streams
+        self.heap = []
+        self.count = 0
+        for n, stream in enumerate(streams):
+            self.count += len(stream)
+            self._push(n, 0)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def first(self):
+        return self.heap[0][3] if len(self.heap) > 0 else None
+
+    def pop(self):
+        _, n, i, lot = heapq.heappop(self.heap)
+        self.count -= 1
+        self._push(n, i + 1)
+        return lot
+
+    def _push(self, n, i):
+        if i < len(self.streams[n]):
+            lot = self.streams[n].lot(i)
+            heapq.heappush(self.heap, (lot.release_at, n, i, lot))
@@ -0,0 +1,193 @@
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import statistics
+import sys
+import time
+import traceback
+from collections import defaultdict, deque
+
+from simulation.dispatching.dispatcher import dispatcher_map
+from simulation.file_instance import FileInstance
+from simulation.greedy import simulate
+from simulation.plugins.cost_plugin import CostPlugin
+from simulation.plugins.statistics_plugin import StatisticsPlugin
+from simulation.randomizer import Randomizer
+from simulation.read import read_all
+from simulation.stats import collect_statistics
+
+# two-sided 95% quantiles of the t distribution by degrees of freedom, normal quantile above
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093,
+        20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+METRICS = ['act', 'throughput', 'on_time', 'tardiness', 'cost']
+
+# parsed datasets, filled before the workers fork so they share them copy-on-write
+files_by_dataset = {}
+settings = {'crn': False}
+
+
+def t_quantile(df):
+    for d in sorted(T_95.keys()):
+        if df <= d:
+            return T_95[d]
+    return 1.960
+
+
+def summarize(stats):
+    lots = stats['lots'].values()
+    return {
+        'act': statistics.mean([l['ACT'] for l in lots]),
+        'throughput': sum([l['throughput'] for l in lots]),
+        'on_time': statistics.mean([l['on_time'] / l['throughput'] * 100 for l in lots]),
+        'tardiness': sum([l['tardiness'] for l in lots]) / 3600 / 24,
+        'cost': stats['plugins'].get('cost'),
+    }
+
+
+def init_worker(files, crn):
+    files_by_dataset.update(files)
+    settings['crn'] = crn
+
+
+def run_replication(task):
+    dataset, dispatcher, seed, days, alg = task
+    try:
+        start_time = time.time()
+        run_to = 3600 * 24 * days
+        Randomizer().seed(seed, settings['crn'])
+        l4m = alg == 'l4m'
+        instance = FileInstance(files_by_dataset[dataset], run_to, l4m, [CostPlugin(), StatisticsPlugin()],
+                                keep_done_lots=False)
+        simulate(instance, dispatcher_map[dispatcher], run_to, l4m, progress=False)
+        instance.finalize()
+        stats, _ = collect_statistics(instance)
+        return dict(dataset=dataset, dispatcher=dispatcher, seed=seed, days=days, alg=alg,
+                    wall_time=time.time() - start_time, summary=summarize(stats), statistics=stats)
+    except Exception:
+        return dict(dataset=dataset, dispatcher=dispatcher, seed=seed, days=days, alg=alg,
+                    error=traceback.format_exc())
+
+
+def replication_worker(conn, task, files, crn):
+    init_worker(files, crn)
+    conn.send(run_replication(task))
+    conn.close()
+
+
+def aggregate(results):
+    groups = defaultdict(list)
+    for r in results:
+        groups[(r['dataset'], r['dispatcher'], r['alg'], r['days'])].append(r['summary'])
+    out = {}
+    for key, summaries in sorted(groups.items()):
+        n = len(summaries)
+        o = {'runs': n}
+        for metric in METRICS:
+            values = [s[metric] for s in summaries if s[metric] is not None]
+            if len(values) == 0:
+                continue
+            mean = statistics.mean(values)
+            stdev = statistics.stdev(values) if len(values) > 1 else 0
+            ci = t_quantile(len(values) - 1) * stdev / math.sqrt(len(values)) if len(values) > 1 else 0
+            o[metric] = {'mean': mean, 'stdev': stdev, 'ci95': ci}
+        out['_'.join([str(k) for k in key])] = o
+    return out
+
+
+def print_aggregate(aggregated):
+    print('Run', 'N', *METRICS, sep='\t')
+    for name, o in aggregated.items():
+        cols = [f"{round(o[m]['mean'], 2)}±{round(o[m]['ci95'], 2)} (sd {round(o[m]['stdev'], 2)})"
+                if m in o else '-' for m in METRICS]
+        print(name, o['runs'], *cols, sep='\t')
+
+
+def run_replications(datasets, dispatchers, seeds, days, alg, workers, retries, out, crn=False):
+    files = {dataset: read_all('datasets/' + dataset) for dataset in datasets}
+    tasks = [(dataset, dispatcher, seed, days, alg)
+             for seed in seeds for dataset in datasets for dispatcher in dispatchers]
+    attempts = defaultdict(int)
+    pending = deque(tasks)
+    # result pipe -> (process, task) of the runs in progress
+    running = {}
+    results = []
+    failed = []
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with io.open(out, 'w') as f:
+        def start(task):
+            # every run gets a fresh process, module level simulator state can not leak between runs
+            attempts[task] += 1
+            reader, writer = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=replication_worker, args=(writer, task, files, crn), daemon=True)
+            process.start()
+            writer.close()
+            running[reader] = (process, task)
+
+        remaining = len(tasks)
+        while remaining > 0:
+            while len(pending) > 0 and len(running) < workers:
+                start(pending.popleft())
+            for reader in multiprocessing.connection.wait(list(running.keys())):
+                process, task = running.pop(reader)
+                try:
+                    r = reader.recv()
+                except EOFError:
+                    r = None
+                reader.close()
+                process.join()
+                if r is None:
+                    # the worker died without a result (killed by a signal or the OOM killer)
+                    r = dict(zip(['dataset', 'dispatcher', 'seed', 'days', 'alg'], task),
+                             error=f'Worker exited with code {process.exitcode}\n')
+                if 'error' in r and attempts[task] <= retries:
+                    sys.stderr.write(f'Run {task} failed, retrying\n{r["error"]}\n')
+                    pending.append(task)
+                    continue
+                remaining -= 1
+                f.write(json.dumps(r) + '\n')
+                f.flush()
+                if 'error' in r:
+                    sys.stderr.write(f'Run {task} failed\n{r["error"]}\n')
+                    failed.append(r)
+                else:
+                    results.append(r)
+                    sys.stderr.write(f'{len(tasks) - remaining}/{len(tasks)} {task} done in {round(r["wall_time"])}s\n')
+                sys.stderr.flush()
+
+    aggregated = aggregate(results)
+    with io.open(os.path.splitext(out)[0] + '_summary.json', 'w') as f:
+        json.dump(aggregated, f, indent=1)
+    print_aggregate(aggregated)
+    return aggregated, failed
+
+
+def main():
+    p = argparse.ArgumentParser(description='Runs seeds x datasets x dispatchers in parallel processes')
+    p.add_argument('--datasets', type=str, nargs='+', default=['SMT2020_HVLM', 'SMT2020_LVHM'])
+    p.add_argument('--dispatchers', type=str, nargs='+', default=['fifo', 'cr'], choices=list(dispatcher_map.keys()))
+    p.add_argument('--seeds', type=int, nargs='+', default=list(range(10)))
+    p.add_argument('--days', type=int, default=730)
+    p.add_argument('--alg', type=str, default='l4m', choices=['l4m', 'm4l'])
+    p.add_argument('--workers', type=int, default=os.cpu_count())
+    p.add_argument('--retries', type=int, default=1)
+    p.add_argument('--out', type=str, default='greedy/replications.jsonl')
+    p.add_argument('--crn', action='store_true', default=False,
+                   help='common random numbers, dispatchers with the same seed see the same fab randomness')
+    a = p.parse_args()
+    os.makedirs(os.path.dirname(a.out) or '.', exist_ok=True)
+    _, failed = run_replications(a.datasets, a.dispatchers, a.seeds, a.days, a.alg, a.workers, a.retries, a.out,
+                                 a.crn)
+    if len(failed) > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import json
+import math
+import sqlite3
+from collections import defaultdict
+
+from simulation.plugins.statistics_plugin import StatisticsPlugin, completion
+
+# one row per report (dataset, dispatcher, seed, horizon), completions and time accounting refer to it by run_id
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, method TEXT, dataset TEXT, dispatcher TEXT, '
+    'seed INTEGER, days INTEGER, time REAL, plugins TEXT, UNIQUE (method, dataset, dispatcher, seed, days))',
+    'CREATE TABLE IF NOT EXISTS lots (run_id INTEGER, lot INTEGER, product TEXT, release_at REAL, done_at REAL, '
+    'deadline_at REAL, waiting_time REAL, waiting_time_batching REAL, processing_time REAL, transport_time REAL)',
+    'CREATE TABLE IF NOT EXISTS machines (run_id INTEGER, machine INTEGER, family TEXT, utilized_time REAL, '
+    'setup_time REAL, pm_time REAL, breakdown_time REAL)',
+    'CREATE TABLE IF NOT EXISTS families (run_id INTEGER, family TEXT, lots_dispatched INTEGER, waiting_time REAL)',
+    'CREATE INDEX IF NOT EXISTS lots_run ON lots (run_id, product)',
+    'CREATE INDEX IF NOT EXISTS machines_run ON machines (run_id, family)',
+    'CREATE INDEX IF NOT EXISTS families_run ON families (run_id)',
+]
+
+# per product of every run, the per product statistics of print_statistics
+LOT_STATISTICS = '''
+    SELECT run_id, product, AVG(done_at - release_at) / 86400 AS ACT, COUNT(*) AS throughput,
+           SUM(done_at <= deadline_at) AS on_time, SUM(MAX(0, done_at - deadline_at)) AS tardiness
+    FROM lots GROUP BY run_id, product
+'''
+
+# per family of every run, the machine statistics of print_statistics
+MACHINE_STATISTICS = '''
+    SELECT m.run_id, m.family,
+           (r.time - AVG(m.pm_time) - AVG(m.breakdown_time)) / r.time AS avail,
+           AVG(m.utilized_time) / (r.time - AVG(m.pm_time) - AVG(m.breakdown_time)) AS util,
+           AVG(m.pm_time) / r.time AS pm, AVG(m.breakdown_time) / r.time AS br, AVG(m.setup_time) / r.time AS setup,
+           COALESCE((SELECT f.waiting_time / f.lots_dispatched / 86400 FROM families f
+                     WHERE f.run_id = m.run_id AND f.family = m.family AND f.lots_dispatched > 0), 0) AS waiting_time
+    FROM machines m JOIN runs r ON r.run_id = m.run_id GROUP BY m.run_id, m.family
+'''
+
+
+def connect(path):
+    # several runs may finish at the same time (greedy_runner.py), writers wait for each other
+    db = sqlite3.connect(path, timeout=600)
+    for statement in SCHEMA:
+        db.execute(statement)
+    return db
+
+
+def write_run(path, instance, method, dataset, dispatcher, seed, days):
+    # stores the lot completions and machine time accounting of the instance as the report of (method, dataset,
+    # dispatcher, seed, days), replacing an earlier report with the same key
+    collector = next((p for p in instance.plugins if isinstance(p, StatisticsPlugin)), None)
+    if collector is not None and collector.keep_completions:
+        completions = collector.completions
+    else:
+        completions = [completion(lot) for lot in instance.done_lots]
+    plugins = {p.get_output_name(): p.get_output_value() for p in instance.plugins if p.get_output_name() is not None}
+
+    db = connect(path)
+    try:
+        with db:
+            earlier = db.execute('SELECT run_id FROM runs WHERE method = ? AND dataset = ? AND dispatcher = ? '
+                                 'AND seed = ? AND days = ?', (method, dataset, dispatcher, seed, days)).fetchall()
+            for table in ['lots', 'machines', 'families', 'runs']:
+                db.executemany(f'DELETE FROM {table} WHERE run_id = ?', earlier)
+            run_id = db.execute('INSERT INTO runs (method, dataset, dispatcher, seed, days, time, plugins) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (method, dataset, dispatcher, seed, days, instance.current_time,
+                                 json.dumps(plugins))).lastrowid
+            db.executemany('INSERT INTO lots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           [(run_id,) + row for row in completions])
+            db.executemany('INSERT INTO machines VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           [(run_id, m.idx, m.family, m.utilized_time, m.setuped_time, m.pmed_time, m.bred_time)
+                            for m in instance.machines])
+            db.executemany('INSERT INTO families VALUES (?, ?, ?, ?)',
+                           [(run_id, family, count, waiting)
+                            for family, (count, waiting) in instance.lot_waiting_at_machine.items()])
+    finally:
+        db.close()
+
+
+def mean_stdev(n, total, squares):
+    # mean and sample standard deviation from the count, sum and sum of squares of a group
+    mean = total / n
+    return mean, (math.sqrt(max(0.0, (squares - n * mean * mean) / (n - 1))) if n > 1 else 0.0)
+
+
+def aggregate(path):
+    # (method, dataset, dispatcher, days) -> (number of runs, {'lots': {product: {metric: (mean, stdev)}},
+    # 'machines': {family: {metric: (mean, stdev)}}}) over the seeds, one grouped query per table
+    db = connect(path)
+    try:
+        runs = {row[:4]: row[4] for row in db.execute('SELECT method, dataset, dispatcher, days, COUNT(*) FROM runs '
+                                                      'GROUP BY method, dataset, dispatcher, days')}
+        out = {group: (n, {'lots': defaultdict(dict), 'machines': defaultdict(dict)}) for group, n in runs.items()}
+        for table, query, key, metrics in [
+            ('lots', LOT_STATISTICS, 'product', ['ACT', 'throughput', 'on_time', 'tardiness']),
+            ('machines', MACHINE_STATISTICS, 'family', ['avail', 'util', 'pm', 'br', 'setup', 'waiting_time']),
+        ]:
+            columns = ', '.join([f'COUNT(s.{m}), SUM(s.{m}), SUM(s.{m} * s.{m})' for m in metrics])
+            rows = db.execute(f'SELECT r.method, r.dataset, r.dispatcher, r.days, s.{key}, {columns} '
+                              f'FROM ({query}) s JOIN runs r ON r.run_id = s.run_id '
+                              f'GROUP BY r.method, r.dataset, r.dispatcher, r.days, s.{key}')
+            for row in rows:
+                group, name, values = row[:4], row[4], row[5:]
+                out[group][1][table][name] = {m: mean_stdev(*values[3 * i:3 * i + 3]) for i, m in enumerate(metrics)}
+        return out
+    finally:
+        db.close()
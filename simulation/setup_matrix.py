@@ -0,0 +1,35 @@
+from typing import Dict, Iterable, Tuple
+
+
+class SetupMatrix:
+    # setup names compiled to integer ids, '' (no setup) is id 0. times[current][new] is the time to change a machine
+    # from setup current to setup new: the (current, new) entry of setup.txt, else the ('', new) entry, else 0.
+    # Changing to id 0 or to the current setup is free.
+    __slots__ = ('ids', 'names', 'times')
+
+    def __init__(self, setups: Dict[Tuple, int], names: Iterable[str] = ()):
+        self.ids = {'': 0}
+        self.names = ['']
+        for name in names:
+            self._add(name)
+        for current, new in setups.keys():
+            self._add(current)
+            self._add(new)
+        n = len(self.names)
+        self.times = [[0] * n for _ in range(n)]
+        for new in range(1, n):
+            default = setups.get(('', self.names[new]), 0)
+            for current in range(n):
+                if current != new:
+                    self.times[current][new] = setups.get((self.names[current], self.names[new]), default)
+
+    def _add(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+
+    def setup_time(self, current_id, step):
+        # time to set up a machine in setup current_id for step, a setup time of the step overrides the matrix
+        if step.setup_time is not None and step.setup_id != 0 and step.setup_id != current_id:
+            return step.setup_time
+        return self.times[current_id][step.setup_id]
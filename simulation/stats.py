@@ -4,52 +4,18 @@ import json
 import statistics
 from collections import defaultdict
 
-from simulation.classes import Lot, Step
+from simulation.plugins.statistics_plugin import StatisticsPlugin
 
 
-def print_statistics(instance, days, dataset, disp, method='greedy', dir='greedy'):
+def collect_statistics(instance):
+    # per product and per family statistics as written by print_statistics, and (APT, DL) per product
     from simulation.instance import Instance
     instance: Instance
-    lot: Lot
-    lots = defaultdict(lambda: {'ACT': [], 'throughput': 0, 'on_time': 0, 'tardiness': 0, 'waiting_time': 0,
-                                'processing_time': 0, 'transport_time': 0, 'waiting_time_batching': 0})
-    apt = {}
-    dl = {}
-    for lot in instance.done_lots:
-        lots[lot.name]['ACT'].append(lot.done_at - lot.release_at)
-        lots[lot.name]['throughput'] += 1
-        lots[lot.name]['tardiness'] += max(0, lot.done_at - lot.deadline_at)
-        lots[lot.name]['waiting_time'] += lot.waiting_time
-        lots[lot.name]['waiting_time_batching'] += lot.waiting_time_batching
-        lots[lot.name]['processing_time'] += lot.processing_time
-        lots[lot.name]['transport_time'] += lot.transport_time
-        if lot.done_at <= lot.deadline_at:
-            lots[lot.name]['on_time'] += 1
-        if lot.name not in apt:
-            apt[lot.name] = sum([s.processing_time.avg() for s in lot.processed_steps])
-            dl[lot.name] = lot.deadline_at - lot.release_at
-    print('Lot', 'APT', 'DL', 'ACT', 'TH', 'ONTIME', 'tardiness', 'wa', 'pr', 'tr')
-    acts = []
-    ths = []
-    ontimes = []
-    for lot_name in sorted(list(lots.keys())):
-        l = lots[lot_name]
-        avg = statistics.mean(l['ACT']) / 3600 / 24
-        lots[lot_name]['ACT'] = avg
-        acts += [avg]
-        th = lots[lot_name]['throughput']
-        ths += [th]
-        ontime = round(l['on_time'] / l['throughput'] * 100)
-        ontimes += [ontime]
-        wa = lots[lot_name]['waiting_time'] / l['throughput'] / 3600 / 24
-        wab = lots[lot_name]['waiting_time_batching'] / l['throughput'] / 3600 / 24
-        pr = lots[lot_name]['processing_time'] / l['throughput'] / 3600 / 24
-        tr = lots[lot_name]['transport_time'] / l['throughput'] / 3600 / 24
-        print(lot_name, round(apt[lot_name] / 3600 / 24, 1), round(dl[lot_name] / 3600 / 24, 1), round(avg, 1), th,
-              ontime, l['tardiness'], wa, wab, pr, tr)
-    print('---------------')
-    print(round(statistics.mean(acts), 2), statistics.mean(ths), statistics.mean(ontimes))
-    print(round(sum(acts), 2), sum(ths), sum(ontimes))
+    # an attached StatisticsPlugin has accumulated the lot statistics already, otherwise replay the finished lots
+    collector = next((p for p in instance.plugins if isinstance(p, StatisticsPlugin)), None)
+    if collector is None:
+        collector = StatisticsPlugin.from_lots(instance.done_lots)
+    lots = collector.lot_statistics()
 
     utilized_times = defaultdict(lambda: [])
     setup_times = defaultdict(lambda: [])
@@ -61,7 +27,6 @@ def print_statistics(instance, days, dataset, disp, method='greedy', dir='greedy
         pm_times[machine.family].append(machine.pmed_time)
         br_times[machine.family].append(machine.bred_time)
 
-    print('Machine', 'Cnt', 'avail' 'util', 'br', 'pm', 'setup')
     machines = defaultdict(lambda: {})
     for machine_name in sorted(list(utilized_times.keys())):
         av = (instance.current_time - statistics.mean(pm_times[machine_name]) - statistics.mean(br_times[machine_name]))
@@ -70,14 +35,8 @@ def print_statistics(instance, days, dataset, disp, method='greedy', dir='greedy
         machines[machine_name]['pm'] = statistics.mean(pm_times[machine_name]) / instance.current_time
         machines[machine_name]['br'] = statistics.mean(br_times[machine_name]) / instance.current_time
         machines[machine_name]['setup'] = statistics.mean(setup_times[machine_name]) / instance.current_time
-        r = instance.lot_waiting_at_machine[machine_name]
-        machines[machine_name]['waiting_time'] = r[1] / r[0] / 3600 / 24
-        print(machine_name, len(utilized_times[machine_name]),
-              round(machines[machine_name]['avail'] * 100, 2),
-              round(machines[machine_name]['util'] * 100, 2),
-              round(machines[machine_name]['br'] * 100, 2),
-              round(machines[machine_name]['pm'] * 100, 2),
-              round(machines[machine_name]['setup'] * 100, 2))
+        r = instance.lot_waiting_at_machine.get(machine_name, (0, 0))
+        machines[machine_name]['waiting_time'] = r[1] / r[0] / 3600 / 24 if r[0] > 0 else 0
 
     plugins = {}
 
@@ -85,9 +44,47 @@ def print_statistics(instance, days, dataset, disp, method='greedy', dir='greedy
         if plugin.get_output_name() is not None:
             plugins[plugin.get_output_name()] = plugin.get_output_value()
 
+    return {
+        'lots': lots,
+        'machines': dict(machines),
+        'plugins': plugins,
+    }, collector.references
+
+
+def print_statistics(instance, days, dataset, disp, method='greedy', dir='greedy'):
+    result, references = collect_statistics(instance)
+    lots, machines = result['lots'], result['machines']
+    print('Lot', 'APT', 'DL', 'ACT', 'TH', 'ONTIME', 'tardiness', 'wa', 'pr', 'tr')
+    acts = []
+    ths = []
+    ontimes = []
+    for lot_name in sorted(list(lots.keys())):
+        l = lots[lot_name]
+        avg = l['ACT']
+        acts += [avg]
+        th = l['throughput']
+        ths += [th]
+        ontime = round(l['on_time'] / l['throughput'] * 100)
+        ontimes += [ontime]
+        wa = l['waiting_time'] / l['throughput'] / 3600 / 24
+        wab = l['waiting_time_batching'] / l['throughput'] / 3600 / 24
+        pr = l['processing_time'] / l['throughput'] / 3600 / 24
+        tr = l['transport_time'] / l['throughput'] / 3600 / 24
+        apt, dl = references[lot_name]
+        print(lot_name, round(apt / 3600 / 24, 1), round(dl / 3600 / 24, 1), round(avg, 1), th,
+              ontime, l['tardiness'], wa, wab, pr, tr)
+    print('---------------')
+    print(round(statistics.mean(acts), 2), statistics.mean(ths), statistics.mean(ontimes))
+    print(round(sum(acts), 2), sum(ths), sum(ontimes))
+
+    print('Machine', 'Cnt', 'avail' 'util', 'br', 'pm', 'setup')
+    for machine_name, m in machines.items():
+        print(machine_name, len(instance.family_machines[machine_name]),
+              round(m['avail'] * 100, 2),
+              round(m['util'] * 100, 2),
+              round(m['br'] * 100, 2),
+              round(m['pm'] * 100, 2),
+              round(m['setup'] * 100, 2))
+
     with io.open(f'{dir}/{method}_{days}days_{dataset}_{disp}.json', 'w') as f:
-        json.dump({
-            'lots': lots,
-            'machines': machines,
-            'plugins': plugins,
-        }, f)
+        json.dump(result, f)
@@ -1,8 +1,5 @@
 import datetime
-
-from simulation.randomizer import Randomizer
-
-r = Randomizer()
+import math
 
 
 def get_interval(num, unit):
@@ -16,23 +13,32 @@ def get_interval(num, unit):
 
 
 class UniformDistribution:
+    __slots__ = ('m', 'l')
 
     def __init__(self, m, l):
         self.m, self.l = m, l
 
-    def sample(self):
-        return r.random.uniform(self.m - self.l / 2, self.m + self.l / 2)
+    def sample(self, randomizer):
+        return randomizer.random.uniform(self.m - self.l / 2, self.m + self.l / 2)
+
+    def sample_from(self, u):
+        # inverse transform of a uniform [0, 1) value, for common random numbers
+        return self.m - self.l / 2 + self.l * u
 
     def avg(self):
         return self.m
 
 
 class ConstantDistribution:
+    __slots__ = ('c',)
 
     def __init__(self, c):
         self.c = c
 
-    def sample(self):
+    def sample(self, randomizer):
+        return self.c
+
+    def sample_from(self, u):
         return self.c
 
     def avg(self):
@@ -40,12 +46,16 @@ class ConstantDistribution:
 
 
 class ExponentialDistribution:
+    __slots__ = ('p',)
 
     def __init__(self, p):
         self.p = p
 
-    def sample(self):
-        return r.random.expovariate(1 / self.p)
+    def sample(self, randomizer):
+        return randomizer.random.expovariate(1 / self.p)
+
+    def sample_from(self, u):
+        return -self.p * math.log(1.0 - u)
 
 
 def get_distribution(typ, unit, *args, multiplier=1):
@@ -0,0 +1,125 @@
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+
+from simulation.plugins.trace_plugin import MAGIC, VERSION, HEADER, RECORD, KINDS, DISPATCH, LOT_FREE, LOT_DONE, \
+    names_path
+
+# numpy view of trace_plugin.RECORD
+DTYPE = np.dtype([('time', '<f8'), ('end', '<f8'), ('aux', '<f8'), ('machine', '<i4'), ('lot', '<i4'),
+                  ('step', '<i4'), ('name', '<i2'), ('kind', 'u1'), ('count', 'u1')])
+assert DTYPE.itemsize == RECORD.size
+
+
+class Trace:
+    # records of a trace file memory mapped as a numpy structured array, in the order the simulation wrote them
+    # (ascending time), and the family and product names the name ids refer to
+
+    def __init__(self, path):
+        with io.open(path, 'rb') as f:
+            magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != DTYPE.itemsize:
+            raise ValueError(f'{path}: not a version {VERSION} trace')
+        # a trace cut off while writing ends with a partial record, it is ignored
+        count = (os.path.getsize(path) - HEADER.size) // DTYPE.itemsize
+        self.records = np.memmap(path, dtype=DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+        with io.open(names_path(path), 'r') as f:
+            names = json.load(f)
+        self.families = names['families']
+        self.products = names['products']
+
+    def __len__(self):
+        return len(self.records)
+
+    def of_kind(self, kind):
+        return self.records[self.records['kind'] == kind]
+
+    def kind_counts(self):
+        counts = np.bincount(self.records['kind'], minlength=max(KINDS) + 1)
+        return {name: int(counts[kind]) for kind, name in KINDS.items()}
+
+    def machine_gantt(self):
+        # one bar per dispatch of a machine: machine, family id, start, end and batch size, batches are reported once
+        dispatches = self.of_kind(DISPATCH)
+        machines, times = dispatches['machine'], dispatches['time']
+        # the lots of a batch are written one after the other
+        first = np.append(True, (machines[1:] != machines[:-1]) | (times[1:] != times[:-1]))
+        bars = dispatches[first]
+        return {'machine': bars['machine'], 'family': bars['name'], 'start': bars['time'], 'end': bars['end'],
+                'lots': bars['count']}
+
+    def lot_gantt(self):
+        # one bar per processed step of a lot: lot, step, machine, family id, start and end (including transport)
+        dispatches = self.of_kind(DISPATCH)
+        return {'lot': dispatches['lot'], 'step': dispatches['step'], 'machine': dispatches['machine'],
+                'family': dispatches['name'], 'start': dispatches['time'], 'end': dispatches['aux']}
+
+    def queue_lengths(self):
+        # family name -> (times, lots waiting at the family after each change), a lot waits from the time it is
+        # free for the step until it is dispatched
+        records = self.records[np.isin(self.records['kind'], [LOT_FREE, DISPATCH])]
+        delta = np.where(records['kind'] == LOT_FREE, 1, -1)
+        return self.step_series(records['name'], records['time'], delta)
+
+    def wip(self):
+        # family name -> (times, lots at the family after each change), a lot is at the family of its step from the
+        # time it is free for the step until it is free for the next one or done
+        records = self.records[np.isin(self.records['kind'], [LOT_FREE, LOT_DONE])]
+        order = np.argsort(records['lot'], kind='stable')
+        lots, times, kinds, families = records['lot'][order], records['time'][order], records['kind'][order], \
+            records['name'][order]
+        enters = kinds == LOT_FREE
+        # a lot leaves the family at its next record, lots still at a family at the end of the trace do not leave
+        has_next = np.append(lots[1:] == lots[:-1], False)
+        leaves = enters & has_next
+        leave_times = np.append(times[1:], 0)[leaves]
+        # leaves first, so a lot going on to the next step of the same family is not counted twice at that time
+        return self.step_series(np.concatenate([families[leaves], families[enters]]),
+                                np.concatenate([leave_times, times[enters]]),
+                                np.concatenate([-np.ones(leaves.sum(), dtype=np.int64),
+                                                np.ones(enters.sum(), dtype=np.int64)]))
+
+    def step_series(self, names, times, delta):
+        # per name id, the running sum of delta in order of time (stable, so equal times keep record order)
+        order = np.lexsort((times, names))
+        names, times, level = names[order], times[order], np.cumsum(delta[order])
+        starts = np.flatnonzero(np.append(True, names[1:] != names[:-1]))
+        # running sums restart at every name
+        offsets = np.repeat(np.append(0, level[starts[1:] - 1]), np.diff(np.append(starts, len(names))))
+        level = level - offsets
+        return {self.families[names[s]]: (times[s:e], level[s:e])
+                for s, e in zip(starts, np.append(starts[1:], len(names)))}
+
+
+def time_average(times, level, end):
+    # time weighted mean from 0 to end of a step series that is 0 before its first change
+    if len(times) == 0 or end <= 0:
+        return 0.0
+    durations = np.diff(np.append(times, end))
+    return float(np.dot(level, durations) / end)
+
+
+def main():
+    p = argparse.ArgumentParser(description='Summarizes a trace written by simulation.plugins.trace_plugin')
+    p.add_argument('trace', type=str)
+    a = p.parse_args()
+
+    trace = Trace(a.trace)
+    end = float(trace.records['time'].max()) if len(trace) > 0 else 0.0
+    print(len(trace), 'records until day', round(end / 3600 / 24, 2))
+    for kind, count in trace.kind_counts().items():
+        print(kind, count)
+    queues, wip = trace.queue_lengths(), trace.wip()
+    print('Family', 'avg_queue', 'max_queue', 'avg_wip', 'max_wip')
+    for family in sorted(wip.keys()):
+        qt, ql = queues.get(family, (np.zeros(0), np.zeros(0, dtype=np.int64)))
+        wt, wl = wip[family]
+        print(family, round(time_average(qt, ql, end), 2), int(ql.max()) if len(ql) > 0 else 0,
+              round(time_average(wt, wl, end), 2), int(wl.max()))
+
+
+if __name__ == '__main__':
+    main()